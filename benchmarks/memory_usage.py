@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Memory usage benchmark of query builders and condition trees.
+
+Usage:
+    PYTHONPATH=. python benchmarks/memory_usage.py [n]
+
+It requires python 3 (tracemalloc)
+"""
+import sys
+import tracemalloc
+from pg_requests import query_facade as qf, Q
+from pg_requests.operators import ConditionOperator
+
+
+def measure(build):
+    """Measure memory allocated by the object built and kept alive
+
+    :param build: callable
+    :return: tuple (bytes, built object)
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    obj = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return size, obj
+
+
+def operands(n):
+    condition = dict(('col_%d' % i, i % 100) for i in range(n))
+    return ConditionOperator.parse_dict_condition(condition)
+
+
+def filter_operands(n):
+    # Operand values are shared ints, the benchmark measures tree overhead
+    return [Q(**{'col_%d' % (i % 10): i % 100}) for i in range(n)]
+
+
+def condition_tree(n):
+    condition = Q(id=0)
+    for i in range(1, n):
+        condition = condition | Q(id=i % 100)
+    return condition
+
+
+def select_builders(n):
+    return [qf.select('users').fields('id', 'name').filter(id=i % 100)
+            .order_by('id').limit(10) for i in range(n)]
+
+
+def update_builders(n):
+    return [qf.update('users').data(name='x', visits=1).filter(id=i % 100)
+            for i in range(n)]
+
+
+def main(n):
+    cases = [
+        ('Operands', operands, 'operand'),
+        ('Q objects', filter_operands, 'operand'),
+        ('OR condition tree', condition_tree, 'operand'),
+        ('SELECT builders', select_builders, 'builder'),
+        ('UPDATE builders', update_builders, 'builder'),
+    ]
+    for name, build, unit in cases:
+        size, _ = measure(lambda: build(n))
+        print('%-20s n=%d: %10d bytes, %6.1f bytes per %s' % (
+            name, n, size, float(size) / n, unit))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
 from pg_requests.query import QueryFacade
-from pg_requests.operators import F, Q
+from pg_requests.operators import F, Q, Param
 
 query_facade = QueryFacade()
@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""Offline index advisor.
+
+It works on a log of built queries, e.g recorded with QueryLog in production
+and dumped to a file, and doesn't need a database connection:
+
+    log = QueryLog()
+    cursor = log.execute(qf.select('users').filter(email='a@b.c'), cursor)
+    ...
+    log.dump(fileobj)
+
+    advice = QueryLog.load(fileobj).advise()
+    for index in advice.indexes:
+        print(index.weight, index.ddl)
+
+Column usage is aggregated per table from WHERE and JOIN ... ON predicates,
+JOIN ... USING, GROUP BY and ORDER BY clauses of the rendered queries, every
+query is weighted by the number of its executions. Candidate indexes are
+composite btree indexes: equality columns first, then a range column or
+ORDER BY / GROUP BY columns.
+
+LIKE predicates with a leading wildcard and ILIKE predicates can't use btree
+indexes, they are reported as pattern warnings.
+"""
+from collections import Counter, namedtuple, OrderedDict
+import json
+import re
+import sys
+
+
+if sys.version_info[0] >= 3:
+    _text_type = str
+else:  # python 2, io text streams accept unicode only
+    _text_type = unicode
+
+
+EQUALITY_OPERATORS = ('=', '= ANY', 'IN', 'IS')
+RANGE_OPERATORS = ('>', '<', '>=', '<=')
+PATTERN_OPERATORS = ('LIKE', 'ILIKE')
+
+_SUBQUERY = '__subquery__'
+_LITERALS = ('NULL', 'TRUE', 'FALSE')
+
+_CLAUSE_RE = re.compile(
+    r'\b(FROM|WHERE|GROUP BY|HAVING|WINDOW|ORDER BY|LIMIT|OFFSET|RETURNING|'
+    r'SET|VALUES|ON CONFLICT|TABLESAMPLE|'
+    r'(?:CROSS|INNER|LEFT OUTER|RIGHT OUTER|FULL OUTER) JOIN)\b')
+_TABLE_RE = re.compile(r"\s*([A-Za-z_][\w.]*)(?:\s+AS\s+'?(\w+)'?)?")
+_JOIN_RE = re.compile(
+    r"\s*(?:LATERAL\s+)?([A-Za-z_][\w.]*)(?:\s+AS\s+'?(\w+)'?)?"
+    r"(?:\s+USING\s+\(([^)]*)\))?")
+_PREDICATE_RE = re.compile(
+    r'(?<![\w.%])([A-Za-z_][\w.]*) '
+    r'(IS NOT|IS|= ANY|>=|<=|!=|=|>|<|IN|ILIKE|LIKE|SIMILAR TO) ?'
+    r'(\(%s\)|%s|[A-Za-z_][\w.]*)')
+_COLUMN_RE = re.compile(r'^([A-Za-z_][\w.]*)(?:\s+(ASC|DESC))?$', re.I)
+
+# Column usage of one table in one query
+_Usage = namedtuple('_Usage', ['equality', 'range', 'order_by', 'group_by',
+                               'join'])
+
+
+class IndexCandidate(namedtuple('IndexCandidate',
+                                ['table', 'columns', 'weight'])):
+    """Proposed index, weight is the number of queries it serves"""
+
+    @property
+    def ddl(self):
+        return 'CREATE INDEX ON {} ({})'.format(self.table,
+                                                ', '.join(self.columns))
+
+
+# Pattern predicate which can't use a btree index
+PatternWarning = namedtuple('PatternWarning',
+                            ['table', 'column', 'operator', 'pattern',
+                             'count'])
+
+
+class TableUsage(object):
+    """Weighted column usage counters of a table"""
+
+    def __init__(self, table):
+        self.table = table
+        self.queries = 0
+        self.equality = Counter()
+        self.range = Counter()
+        self.order_by = Counter()
+        self.group_by = Counter()
+        self.join = Counter()
+
+    def add(self, usage, count):
+        self.queries += count
+        for name in _Usage._fields:
+            counter = getattr(self, name)
+            for column in getattr(usage, name):
+                counter[column] += count
+
+    def __repr__(self):
+        return '%s(table=%s, queries=%d)' % (self.__class__.__name__,
+                                             self.table, self.queries)
+
+
+# Advisor result: {table: TableUsage}, list of IndexCandidate ordered by
+# weight, list of PatternWarning
+Advice = namedtuple('Advice', ['tables', 'indexes', 'warnings'])
+
+
+def _extract_subqueries(sql, values):
+    """Cut parenthesized sub-queries out of sql. Values of a sub-query are
+    cut out as well, so placeholders of the rest are still aligned with
+    values
+
+    :return: tuple (sql, values, list of (sub-query sql, values))
+    """
+    subqueries = []
+    while True:
+        start = sql.find('(SELECT ')
+        if start == -1:
+            return sql, values, subqueries
+
+        depth, end = 0, len(sql)
+        for idx in range(start, len(sql)):
+            if sql[idx] == '(':
+                depth += 1
+            elif sql[idx] == ')':
+                depth -= 1
+                if depth == 0:
+                    end = idx + 1
+                    break
+
+        before = sql.count('%s', 0, start)
+        inner = sql[start + 1:end - 1]
+        size = inner.count('%s')
+        subqueries.append((inner, values[before:before + size]))
+        values = values[:before] + values[before + size:]
+        sql = sql[:start] + _SUBQUERY + sql[end:]
+
+
+def _clauses(sql):
+    """Split sql into top-level clauses
+
+    :return: list of tuples (keyword, start, end) of the clause body
+    """
+    clauses, depth, pos = [], 0, 0
+    for match in _CLAUSE_RE.finditer(sql):
+        depth += sql.count('(', pos, match.start()) - \
+            sql.count(')', pos, match.start())
+        pos = match.start()
+        if depth != 0:
+            continue
+        if clauses:
+            keyword, start, _ = clauses[-1]
+            clauses[-1] = (keyword, start, match.start())
+        clauses.append((match.group(1), match.end(), len(sql)))
+    return clauses
+
+
+def _split_columns(text):
+    """Split ORDER BY / GROUP BY clause body into plain column names,
+    expressions are skipped
+    """
+    columns = []
+    for part in text.split(','):
+        match = _COLUMN_RE.match(part.strip())
+        if match:
+            columns.append(match.group(1))
+    return columns
+
+
+class _QueryShape(object):
+    """Tables and column usage of a rendered query"""
+
+    def __init__(self, sql, values):
+        self.sql, self.values, subqueries = _extract_subqueries(
+            sql, tuple(values))
+        self.subqueries = [_QueryShape(*subquery) for subquery in subqueries]
+        self.main_table = None
+        # {alias or table name: table name}
+        self.aliases = {}
+        self.usage = OrderedDict()
+        # list of (table, column, operator, value)
+        self.patterns = []
+        self._parse()
+
+    def _table(self, table, alias=None):
+        if table == _SUBQUERY:
+            return None
+        self.aliases[table] = table
+        if alias:
+            self.aliases[alias] = table
+        if table not in self.usage:
+            self.usage[table] = _Usage([], [], [], [], [])
+        return table
+
+    def _resolve(self, column):
+        """Resolve column table
+
+        :return: tuple (table, column name) or (None, None)
+        """
+        if '.' in column:
+            prefix, name = column.rsplit('.', 1)
+            table = self.aliases.get(prefix, prefix)
+        else:
+            table, name = self.main_table, column
+        if table not in self.usage:
+            return None, None
+        return table, name
+
+    def _add(self, kind, column):
+        table, name = self._resolve(column)
+        if table is not None:
+            columns = getattr(self.usage[table], kind)
+            if name not in columns:
+                columns.append(name)
+
+    def _parse(self):
+        sql, conditions = self.sql, []
+        for keyword, start, end in _clauses(sql):
+            if keyword == 'FROM' and self.main_table is None:
+                match = _TABLE_RE.match(sql, start, end)
+                if match:
+                    self.main_table = self._table(*match.groups())
+            elif keyword.endswith('JOIN'):
+                match = _JOIN_RE.match(sql, start, end)
+                if match:
+                    table = self._table(match.group(1), match.group(2))
+                    if table is not None and match.group(3):
+                        for column in _split_columns(match.group(3)):
+                            self._add('join', table + '.' + column)
+                            if self.main_table is not None:
+                                self._add('join',
+                                          self.main_table + '.' + column)
+                    conditions.append((match.end(), end))
+            elif keyword == 'WHERE':
+                conditions.append((start, end))
+            elif keyword == 'GROUP BY':
+                for column in _split_columns(sql[start:end]):
+                    self._add('group_by', column)
+            elif keyword == 'ORDER BY':
+                for column in _split_columns(sql[start:end]):
+                    self._add('order_by', column)
+
+        if self.main_table is None:
+            # UPDATE {table} SET ... / DELETE FROM {table}
+            match = re.match(r"\s*(?:UPDATE|DELETE\s+FROM)\s+"
+                             r"([A-Za-z_][\w.]*)", sql)
+            if match:
+                self.main_table = self._table(match.group(1))
+
+        for start, end in conditions:
+            for match in _PREDICATE_RE.finditer(sql, start, end):
+                self._add_predicate(match)
+
+    def _add_predicate(self, match):
+        column, operator, rhs = match.groups()
+        if '%s' not in rhs and rhs.upper() not in _LITERALS:
+            # column to column predicate, e.g JOIN ... ON or F object
+            if self._resolve(rhs)[0] is None and \
+                    operator in EQUALITY_OPERATORS:
+                # Outer query column of a correlated sub-query, it's an
+                # equality lookup on every outer row
+                self._add('equality', column)
+            else:
+                self._add('join', column)
+                self._add('join', rhs)
+        elif operator in EQUALITY_OPERATORS:
+            self._add('equality', column)
+        elif operator in RANGE_OPERATORS:
+            self._add('range', column)
+        elif operator in PATTERN_OPERATORS:
+            table, name = self._resolve(column)
+            if table is None:
+                return
+            value = None
+            if '%s' in rhs:
+                idx = self.sql.count('%s', 0, match.start(3))
+                if idx < len(self.values):
+                    value = self.values[idx]
+            self.patterns.append((table, name, operator, value))
+
+    def shapes(self):
+        """Iterate over the query and its sub-queries"""
+        yield self
+        for subquery in self.subqueries:
+            for shape in subquery.shapes():
+                yield shape
+
+
+def _is_unindexable(operator, pattern):
+    if operator == 'ILIKE':
+        return True
+    return hasattr(pattern, 'startswith') and pattern.startswith(('%', '_'))
+
+
+def _candidate_columns(table_usage, usage, joined):
+    """Composite index columns: equality columns (and join columns of a
+    joined table) ordered by their overall usage, then the first range column
+    or ORDER BY / GROUP BY columns
+    """
+    def rank(column):
+        return (-(table_usage.equality[column] + table_usage.join[column]),
+                column)
+
+    columns = set(usage.equality)
+    if joined:
+        columns.update(usage.join)
+    columns = sorted(columns, key=rank)
+    if usage.range:
+        tail = usage.range[:1]
+    else:
+        tail = usage.order_by or usage.group_by
+    for column in tail:
+        if column not in columns:
+            columns.append(column)
+    return tuple(columns)
+
+
+def _merge_prefixes(candidates):
+    """Merge candidates which are prefixes of longer ones on the same table,
+    the longer index serves their queries too
+    """
+    merged = OrderedDict()
+    ordered = sorted(candidates.items(), key=lambda item: -len(item[0][1]))
+    for (table, columns), weight in ordered:
+        for (other_table, other_columns) in merged:
+            if other_table == table and \
+                    other_columns[:len(columns)] == columns:
+                merged[(other_table, other_columns)] += weight
+                break
+        else:
+            merged[(table, columns)] = weight
+    return merged
+
+
+def advise(entries):
+    """Aggregate column usage and propose indexes
+
+    :param entries: iterable of (sql, values) tuples or query builders
+    :return: Advice
+    """
+    # Shape aggregation: {sql: (shape, number of executions)}
+    shapes = OrderedDict()
+    tables = OrderedDict()
+    patterns = Counter()
+    for entry in entries:
+        sql, values = entry.get_raw() if hasattr(entry, 'get_raw') else entry
+        if sql in shapes:
+            shape, count = shapes[sql]
+            shapes[sql] = (shape, count + 1)
+            if any(item.patterns for item in shape.shapes()):
+                # Pattern values vary between executions of a shape
+                shape = _QueryShape(sql, values)
+        else:
+            shape = _QueryShape(sql, values)
+            shapes[sql] = (shape, 1)
+        for item in shape.shapes():
+            for table, column, operator, pattern in item.patterns:
+                if _is_unindexable(operator, pattern):
+                    patterns[(table, column, operator, pattern)] += 1
+
+    for shape, count in shapes.values():
+        for item in shape.shapes():
+            for table, usage in item.usage.items():
+                if table not in tables:
+                    tables[table] = TableUsage(table)
+                tables[table].add(usage, count)
+
+    candidates = Counter()
+    for shape, count in shapes.values():
+        for item in shape.shapes():
+            for table, usage in item.usage.items():
+                columns = _candidate_columns(tables[table], usage,
+                                             table != item.main_table)
+                if columns:
+                    candidates[(table, columns)] += count
+
+    indexes = [IndexCandidate(table, columns, weight)
+               for (table, columns), weight
+               in _merge_prefixes(candidates).items()]
+    indexes.sort(key=lambda index: -index.weight)
+    warnings = [PatternWarning(table, column, operator, pattern, count)
+                for (table, column, operator, pattern), count
+                in patterns.items()]
+    warnings.sort(key=lambda warning: -warning.count)
+    return Advice(tables, indexes, warnings)
+
+
+class QueryLog(object):
+    """Log of built queries for the offline index advisor. It's stored as
+    json lines: {"sql": ..., "values": [...]}, values which are not json
+    serializable are stored as strings
+    """
+
+    def __init__(self, entries=None):
+        self.entries = list(entries or ())
+
+    def record(self, query):
+        """Record query
+
+        :param query: query builder instance or (sql, values) tuple
+        """
+        sql, values = query.get_raw() if hasattr(query, 'get_raw') else query
+        self.entries.append((sql, tuple(values)))
+
+    def execute(self, query, cursor):
+        """Record and execute query
+
+        :param query: query builder instance
+        :param cursor: connection.cursor: instance
+        :return: cursor
+        """
+        self.record(query)
+        return query.execute(cursor)
+
+    def dump(self, fileobj):
+        """Write the log as JSON lines
+
+        :param fileobj: text file-like object
+        """
+        for sql, values in self.entries:
+            # NOTE: json.dumps returns ascii bytes str on python 2
+            fileobj.write(_text_type(json.dumps(
+                {'sql': sql, 'values': list(values)}, default=str)))
+            fileobj.write(_text_type('\n'))
+
+    @classmethod
+    def load(cls, fileobj):
+        entries = []
+        for line in fileobj:
+            if line.strip():
+                entry = json.loads(line)
+                entries.append((entry['sql'], tuple(entry['values'])))
+        return cls(entries)
+
+    def advise(self):
+        """Run the index advisor on the log
+
+        :return: Advice
+        """
+        return advise(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
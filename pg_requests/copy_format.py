@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""Column-oriented COPY FROM STDIN encoding.
+
+Columns are encoded column by column: numpy arrays of fixed width types are
+packed into binary COPY format with a single structured array, everything
+else is converted to COPY text format a column at a time. Rows never exist
+as python tuples.
+
+numpy is optional, without it text format is used.
+
+Binary format requires table column types to match array types exactly:
+
+    bool --> boolean
+    int8, uint8, int16 --> smallint
+    uint16, int32 --> integer
+    uint32, int64 --> bigint
+    float32 --> real
+    float64 --> double precision
+    datetime64 --> timestamp (timestamptz, values are in UTC)
+
+Pass format='text' to let postgres cast values to the column types. In text
+format dicts are encoded as JSON and lists (tuples) as array literals.
+"""
+import binascii
+import datetime
+import io
+import json
+import struct
+import sys
+try:
+    import numpy
+except ImportError:  # numpy is optional
+    numpy = None
+
+
+if sys.version_info[0] >= 3:
+    _text_type = str
+else:  # python 2, str is bytes there and it's treated as text
+    _text_type = unicode
+
+
+FORMATS = ('binary', 'text')
+
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+BINARY_TRAILER = struct.pack('>h', -1)
+
+# Postgres epoch 2000-01-01 in microseconds since unix epoch
+PG_EPOCH_US = 946684800000000
+
+# numpy dtype kind and item size --> binary COPY value type
+_BINARY_TYPES = {
+    ('b', 1): '>?',
+    ('i', 1): '>i2',
+    ('u', 1): '>i2',
+    ('i', 2): '>i2',
+    ('u', 2): '>i4',
+    ('i', 4): '>i4',
+    ('u', 4): '>i8',
+    ('i', 8): '>i8',
+    ('f', 4): '>f4',
+    ('f', 8): '>f8',
+}
+
+_TEXT_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+TEXT_NULL = '\\N'
+
+
+def _is_array(column):
+    return numpy is not None and isinstance(column, numpy.ndarray)
+
+
+def _binary_type(column):
+    """Binary COPY value type of a column
+
+    :return: numpy dtype string or None if column can't be binary encoded
+    """
+    if not _is_array(column) or column.ndim != 1:
+        return None
+    if column.dtype.kind == 'M':
+        if numpy.isnat(column).any():
+            # NULLs are variable length, use text format
+            return None
+        return '>i8'
+    return _BINARY_TYPES.get((column.dtype.kind, column.dtype.itemsize))
+
+
+def _binary_values(column):
+    if column.dtype.kind == 'M':
+        return column.astype('datetime64[us]').astype('int64') - PG_EPOCH_US
+    return column
+
+
+def encode_binary(columns):
+    """Encode columns in binary COPY format. Every row is a fixed width
+    record: fields count, then length and value of every field, so all rows
+    are packed with one structured numpy array
+
+    :param columns: list of numpy arrays
+    :rtype : bytes
+    """
+    types = [_binary_type(column) for column in columns]
+    if None in types:
+        raise ValueError('Columns of types %s can not be binary encoded' % (
+            [str(getattr(column, 'dtype', type(column).__name__))
+             for column in columns], ))
+
+    fields = [('count', '>i2')]
+    for idx, value_type in enumerate(types):
+        fields.append(('size%d' % idx, '>i4'))
+        fields.append(('value%d' % idx, value_type))
+
+    rows = numpy.empty(len(columns[0]) if columns else 0,
+                       dtype=numpy.dtype(fields))
+    rows['count'] = len(columns)
+    for idx, (column, value_type) in enumerate(zip(columns, types)):
+        rows['size%d' % idx] = numpy.dtype(value_type).itemsize
+        rows['value%d' % idx] = _binary_values(column)
+    return BINARY_HEADER + rows.tobytes() + BINARY_TRAILER
+
+
+def _escape_text(value):
+    for char, escaped in _TEXT_ESCAPES:
+        if char in value:
+            value = value.replace(char, escaped)
+    return value
+
+
+def _plain_text(value):
+    """Text representation of a not NULL value before COPY escaping"""
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (bytearray, memoryview)) or (
+            isinstance(value, bytes) and bytes is not str):
+        return '\\x' + binascii.hexlify(bytes(value)).decode('ascii')
+    if isinstance(value, dict):
+        # json / jsonb
+        return json.dumps(value)
+    if isinstance(value, (list, tuple)):
+        return _array_literal(value)
+    if not isinstance(value, (str, _text_type)):
+        value = _text_type(value)
+    return value
+
+
+def _array_literal(values):
+    """Array literal, e.g {"1","a b",NULL,{"2","3"}}. Items are quoted,
+    postgres casts them to the array element type
+    """
+    items = []
+    for value in values:
+        if value is None:
+            items.append('NULL')
+        elif isinstance(value, (list, tuple)):
+            items.append(_array_literal(value))
+        else:
+            value = _plain_text(value)
+            items.append(
+                '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(items) + '}'
+
+
+def _text_value(value):
+    if value is None:
+        return TEXT_NULL
+    return _escape_text(_plain_text(value))
+
+
+def _text_column(column):
+    """Convert column to a list of COPY text format values"""
+    if _is_array(column):
+        kind = column.dtype.kind
+        if kind in 'iuf':
+            # NOTE: numpy float to str conversion is the shortest repr
+            return column.astype(str).tolist()
+        if kind == 'b':
+            return numpy.where(column, 't', 'f').tolist()
+        if kind == 'M':
+            values = numpy.datetime_as_string(column).astype(object)
+            values[numpy.isnat(column)] = TEXT_NULL
+            return values.tolist()
+        column = column.tolist()
+    return [_text_value(value) for value in column]
+
+
+def encode_text(columns):
+    """Encode columns in COPY text format
+
+    :param columns: list of columns: numpy arrays, array.array, lists
+    :rtype : bytes
+    """
+    text_columns = [_text_column(column) for column in columns]
+    if not text_columns or not text_columns[0]:
+        return b''
+    lines = '\n'.join(map('\t'.join, zip(*text_columns)))
+    return (lines + '\n').encode('utf-8')
+
+
+def choose_format(columns):
+    """Binary format if all columns are binary encodable numpy arrays"""
+    if columns and all(_binary_type(column) is not None
+                       for column in columns):
+        return 'binary'
+    return 'text'
+
+
+def is_autocommit(cursor):
+    """Check if the cursor connection is in autocommit mode"""
+    connection = getattr(cursor, 'connection', None)
+    return getattr(connection, 'autocommit', False) is True
+
+
+def apply_settings(cursor, settings_raw):
+    """Apply execution settings before a COPY statement. COPY can't be sent
+    in the same request, so settings are set for the current transaction
+    with a separate statement
+
+    :param cursor: connection.cursor: instance
+    :param settings_raw: tuple: settings query, see
+        QueryBuilder._get_settings_raw
+    :raise ValueError: in autocommit mode, every statement is a transaction
+        there and settings would be reset before COPY
+    """
+    if is_autocommit(cursor):
+        raise ValueError('Execution settings of COPY require a transaction, '
+                         'they have no effect in autocommit mode')
+    cursor.execute(*settings_raw)
+
+
+class CopyFrom(object):
+    """COPY {table} ({columns}) FROM STDIN statement of column-oriented data
+
+    Usage:
+        qf.insert('metrics')\
+            .from_columns({'ts': ts_array, 'value': value_array})\
+            .execute(cursor)
+    """
+
+    def __init__(self, table_name, columns, format=None, settings_raw=None):
+        """
+
+        :param table_name: str
+        :param columns: dict | list of tuples: {column name: column values}
+        :param format: str: 'binary', 'text' or None to choose the format
+            by columns types
+        :param settings_raw: tuple: execution settings query, see
+            QueryBuilder._get_settings_raw
+        """
+        if isinstance(columns, dict):
+            columns = list(columns.items())
+        if not columns:
+            raise ValueError('Columns are required')
+        self.table_name = table_name
+        self.names = [name for name, _ in columns]
+        self.columns = [values for _, values in columns]
+
+        sizes = set(len(values) for values in self.columns)
+        if len(sizes) != 1:
+            raise ValueError('Columns must have the same length, got %s' %
+                             dict(zip(self.names, map(len, self.columns))))
+
+        if format is None:
+            format = choose_format(self.columns)
+        if format not in FORMATS:
+            raise ValueError("Wrong COPY format '%s', must be one of %s" % (
+                format, FORMATS))
+        self.format = format
+        self.settings_raw = settings_raw
+
+    @property
+    def sql(self):
+        return 'COPY {} ({}) FROM STDIN WITH (FORMAT {})'.format(
+            self.table_name, ', '.join(self.names), self.format)
+
+    def encode(self):
+        """Encode COPY payload
+
+        :rtype : bytes
+        """
+        if self.format == 'binary':
+            return encode_binary(self.columns)
+        return encode_text(self.columns)
+
+    def execute(self, cursor):
+        """Load data with COPY FROM STDIN
+
+        :param cursor: connection.cursor: instance
+        :return: cursor
+        :raise ValueError: if execution settings are set in autocommit mode,
+            see apply_settings
+        """
+        if self.settings_raw is not None:
+            apply_settings(cursor, self.settings_raw)
+        cursor.copy_expert(self.sql, io.BytesIO(self.encode()))
+        return cursor
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __repr__(self):
+        return '%s(sql=%s, rows=%d)' % (self.__class__.__name__, self.sql,
+                                        len(self))
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import copy
+import heapq
+import itertools
+import re
+from multiprocessing.pool import ThreadPool
+
+
+class _SortKey(object):
+    """Row sort key of ORDER BY columns. NULLs placement is set per column,
+    by default NULLs are greater than any value, the same as the default
+    Postgres ordering.
+
+    NOTE: values are compared with python operators, text is compared by code
+    points. It matches the shards ordering for the "C" collation only, text
+    columns must be ordered with COLLATE "C" (e.g defined on the column)
+    """
+    __slots__ = ('values', 'desc', 'nulls_first')
+
+    def __init__(self, values, desc, nulls_first):
+        self.values = values
+        self.desc = desc
+        self.nulls_first = nulls_first
+
+    def __lt__(self, other):
+        for a, b, desc, nulls_first in zip(self.values, other.values,
+                                           self.desc, self.nulls_first):
+            if a == b:
+                continue
+            if a is None:
+                return nulls_first
+            if b is None:
+                return not nulls_first
+            less = a < b
+            return not less if desc else less
+        return False
+
+    def __eq__(self, other):
+        return not (self < other or other < self)
+
+
+# Plain column name, expressions can't be evaluated on merge
+_COLUMN_RE = re.compile(r'^[A-Za-z_][\w$]*(\.[A-Za-z_][\w$]*)*$')
+
+_DIRECTIONS = {'ASC': False, 'DESC': True}
+_NULLS = {'FIRST': True, 'LAST': False}
+
+
+def _parse_order_item(item):
+    """Parse ORDER BY item: column [ASC | DESC] [NULLS { FIRST | LAST }]
+
+    :return: tuple (column name, is descending, nulls first or None if not
+        set)
+    :raise ValueError: if item has unsupported modifiers
+    """
+    parts = item.split()
+    modifiers = [part.upper() for part in parts[1:]]
+    desc, nulls = False, None
+    if modifiers and modifiers[0] in _DIRECTIONS:
+        desc = _DIRECTIONS[modifiers.pop(0)]
+    if len(modifiers) == 2 and modifiers[0] == 'NULLS' and \
+            modifiers[1] in _NULLS:
+        nulls = _NULLS[modifiers[1]]
+        modifiers = []
+    if not parts or modifiers or not _COLUMN_RE.match(parts[0]):
+        raise ValueError("Unsupported ORDER BY item '%s'" % item)
+    return parts[0], desc, nulls
+
+
+def parse_order_by(query):
+    """Get ORDER BY columns of a query
+
+    :param query: SelectQuery
+    :return: list of tuples (column name, is descending, nulls first)
+    :raise ValueError: if ORDER BY items have unsupported modifiers
+    """
+    token = query._get_token('ORDER_BY')
+    if not token.is_set:
+        return []
+
+    items = [_parse_order_item(item) for item in token.value.value]
+
+    # .desc() option is applied to the last column
+    if query._get_token('DESC').is_set:
+        name, _, nulls = items[-1]
+        items[-1] = (name, True, nulls)
+
+    # NULLs are first in descending order by default
+    return [(name, desc, desc if nulls is None else nulls)
+            for name, desc, nulls in items]
+
+
+def _column_indexes(description, columns):
+    names = [column[0] for column in description]
+    indexes = []
+    for name, _, _ in columns:
+        # 'users.name' column is fetched as 'name'
+        short_name = name.split('.')[-1]
+        if short_name not in names:
+            raise ValueError(
+                "ORDER BY column '%s' is not in the query result" % name)
+        indexes.append(names.index(short_name))
+    return indexes
+
+
+def merge(cursors, columns):
+    """Merge rows of cursors ordered by columns
+
+    :param cursors: list of executed cursors
+    :param columns: list of tuples (column name, is descending, nulls first),
+        see parse_order_by
+    :return: iterator of rows
+    """
+    if not columns:
+        for row in itertools.chain(*cursors):
+            yield row
+        return
+
+    desc = tuple(d for _, d, _ in columns)
+    nulls_first = tuple(n for _, _, n in columns)
+    heap = []
+    for idx, cursor in enumerate(cursors):
+        if cursor.description is None:
+            continue
+        indexes = _column_indexes(cursor.description, columns)
+        rows = iter(cursor)
+        for row in rows:
+            key = _SortKey(tuple(row[i] for i in indexes), desc,
+                           nulls_first)
+            heap.append((key, idx, row, rows, indexes))
+            break
+    heapq.heapify(heap)
+
+    while heap:
+        key, idx, row, rows, indexes = heap[0]
+        yield row
+        for row in rows:
+            key = _SortKey(tuple(row[i] for i in indexes), desc,
+                           nulls_first)
+            heapq.heapreplace(heap, (key, idx, row, rows, indexes))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+def fanout(query, connections, max_workers=None):
+    """Execute SELECT query concurrently on shard connections and merge
+    results. Rows are merged according to the query ORDER BY, LIMIT and
+    OFFSET are applied to the merged result.
+
+    Usage:
+        for row in qf.fanout(qf.select('events').order_by('ts').desc()
+                               .limit(100), [shard_1, shard_2]):
+            ...
+
+    NOTE: ORDER BY columns must be a part of the query result, ORDER BY items
+    are plain columns with optional ASC/DESC and NULLS FIRST/LAST. Rows are
+    merged with python comparison, text columns must have "C" collation
+    (code points order), otherwise the merged order and LIMIT are wrong for
+    e.g 'a' and 'B' values of en_US collation
+
+    :param query: SelectQuery
+    :param connections: list of connections
+    :param max_workers: int: max number of threads, one per connection by
+        default
+    :return: iterator of rows
+    """
+    columns = parse_order_by(query)
+    limit_token = query._get_token('LIMIT')
+    offset_token = query._get_token('OFFSET')
+    limit = limit_token.value.value if limit_token.is_set else None
+    offset = offset_token.value.value if offset_token.is_set else 0
+
+    # Every shard must return enough rows to cover global limit and offset
+    shard_query = copy.deepcopy(query)
+    shard_query._get_token('OFFSET').reset()
+    if limit is not None:
+        shard_query.limit(limit + offset)
+
+    pool = ThreadPool(max_workers or len(connections) or 1)
+    try:
+        cursors = pool.map(lambda conn: shard_query.execute(conn.cursor()),
+                           connections)
+    finally:
+        pool.close()
+        pool.join()
+
+    stop = None if limit is None else offset + limit
+    return itertools.islice(merge(cursors, columns), offset, stop)
@@ -1,5 +1,168 @@
 # -*- coding: utf-8 -*-
-from pg_requests.tokens import CommaValue
+from pg_requests.operators import Evaluable
+from pg_requests.tokens import CommaValue, FilterValue
+
+
+def window_spec(partition_by=None, order_by=None):
+    """Render window specification
+
+    Example:
+        window_spec('region', ['created_at DESC']) -->
+            'PARTITION BY region ORDER BY created_at DESC'
+
+    :param partition_by: str | list of str
+    :param order_by: str | list of str
+    :rtype : str
+    """
+    parts = []
+    if partition_by:
+        if isinstance(partition_by, str):
+            partition_by = (partition_by, )
+        parts.append('PARTITION BY {}'.format(CommaValue(partition_by).eval()))
+    if order_by:
+        if isinstance(order_by, str):
+            order_by = (order_by, )
+        parts.append('ORDER BY {}'.format(CommaValue(order_by).eval()))
+    return ' '.join(parts)
+
+
+def _grouping_element(element):
+    """Render grouping element: column (or expression) or a group of
+    columns, empty group is the grand total
+    """
+    if isinstance(element, (list, tuple)):
+        return '({})'.format(CommaValue(element).eval())
+    return element
+
+
+def _grouping(name, elements):
+    if not elements:
+        raise ValueError('%s requires at least one element' % name)
+    return '{} ({})'.format(
+        name, ', '.join([_grouping_element(e) for e in elements]))
+
+
+def rollup(*elements):
+    """Render ROLLUP grouping element: all the prefixes of the columns list
+    down to the grand total
+
+    Example:
+        rollup('region', 'city') --> 'ROLLUP (region, city)'
+        rollup('region', ('city', 'street')) -->
+            'ROLLUP (region, (city, street))'
+
+    :param elements: str | tuple of str
+    :rtype : str
+    """
+    return _grouping('ROLLUP', elements)
+
+
+def cube(*elements):
+    """Render CUBE grouping element: all the subsets of the columns
+
+    Example:
+        cube('region', 'product') --> 'CUBE (region, product)'
+
+    :param elements: str | tuple of str
+    :rtype : str
+    """
+    return _grouping('CUBE', elements)
+
+
+def grouping_sets(*sets):
+    """Render GROUPING SETS element
+
+    Example:
+        grouping_sets(('region', 'city'), 'region', ()) -->
+            'GROUPING SETS ((region, city), region, ())'
+
+    :param sets: str | tuple of str | rollup()/cube() element, empty tuple is
+        the grand total
+    :rtype : str
+    """
+    return _grouping('GROUPING SETS', sets)
+
+
+class FunctionCall(str, Evaluable):
+    """Rendered function call. It is a string, so it can be used everywhere a
+    field name is used, plus it supports window and aggregate FILTER clauses.
+    Bound parameters of a FILTER clause are kept in .values, they are
+    collected from SELECT fields, DISTINCT ON, GROUP BY and ORDER BY items.
+    Other clauses raise ValueError for a function call with parameters
+
+    Example:
+        fn.SUM('amount').filter(status='paid') -->
+            'SUM(amount) FILTER (WHERE ( status = %s ))', values: ('paid', )
+        fn.ROW_NUMBER().over(partition_by='user_id', order_by='created_at') -->
+            'ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at)'
+    """
+
+    def __new__(cls, name, args, alias=None, condition=None, window=None):
+        parts = ['{}({})'.format(name, args)]
+        values = ()
+        if condition is not None:
+            condition_str, values = condition.eval()
+            parts.append('FILTER (WHERE {})'.format(condition_str))
+        if window is not None:
+            parts.append('OVER {}'.format(window))
+        if alias:
+            parts.append("AS '{}'".format(alias))
+
+        obj = str.__new__(cls, ' '.join(parts))
+        obj.name = name
+        obj.args = args
+        obj.alias = alias
+        obj.condition = condition
+        obj.window = window
+        obj.values = values
+        return obj
+
+    def __getnewargs__(self):
+        # Required by copy and pickle, str arguments are not enough here
+        return self.name, self.args, self.alias, self.condition, self.window
+
+    def _replace(self, **kwargs):
+        params = dict(name=self.name, args=self.args, alias=self.alias,
+                      condition=self.condition, window=self.window)
+        params.update(kwargs)
+        return FunctionCall(**params)
+
+    def filter(self, *args, **kwargs):
+        """Aggregate FILTER (WHERE ...) clause. Accepts the same conditions as
+        SelectQuery.filter(), multiple calls are concatenated with AND
+
+        :rtype : FunctionCall
+        """
+        condition = args[0] if args else kwargs
+        if self.condition is not None:
+            # Don't modify the condition of this function call
+            existing = FilterValue(self.condition.value)
+            existing.update(condition)
+            condition = existing
+        else:
+            condition = FilterValue(condition)
+        return self._replace(condition=condition)
+
+    def over(self, window=None, partition_by=None, order_by=None):
+        """Window function OVER clause
+
+        Usage:
+            fn.RANK().over(partition_by='dept', order_by=['salary DESC'])
+            fn.SUM('amount').over('w')  # named window, see SelectQuery.window
+
+        :param window: str: name of a window defined by SelectQuery.window()
+        :param partition_by: str | list of str
+        :param order_by: str | list of str
+        :rtype : FunctionCall
+        """
+        if window is None:
+            window = '({})'.format(window_spec(partition_by, order_by))
+        return self._replace(window=window)
+
+    def eval(self):
+        if self.values:
+            return str(self), self.values
+        return str(self)
 
 
 class Function(object):
@@ -12,12 +175,7 @@ class Function(object):
     # def __call__(self, *args, alias=None):
     def __call__(self, *args, **kwargs):
         value = CommaValue(args)
-        alias = kwargs.get('alias')
-        if alias:
-            fn_str = "{}({}) AS '{}'".format(self.name, value.eval(), alias)
-        else:
-            fn_str = "{}({})".format(self.name, value.eval())
-        return fn_str
+        return FunctionCall(self.name, value.eval(), alias=kwargs.get('alias'))
 
     def __repr__(self):
         return "%s(name=%s(*args))" % (self.__class__.__name__, self.name)
@@ -29,8 +187,13 @@ class FunctionFactory(object):
     Usage:
         fn.COUNT('*') --> 'COUNT(*)'
         fn.COUNT('*', alias='count_all') --> 'COUNT(*) AS count_all'
+        fn.SUM('amount').filter(status='paid') --> aggregate FILTER clause
+        fn.ROW_NUMBER().over(order_by='id') --> window function
+        fn.GROUPING('region', 'city') --> bit mask of columns aggregated
+            in a subtotal row, see rollup()
     """
-    _FUNCTIONS = ('COUNT', 'AVG', 'MIN', 'MAX', 'SUM')
+    _FUNCTIONS = ('COUNT', 'AVG', 'MIN', 'MAX', 'SUM', 'ROW_NUMBER', 'RANK',
+                  'DENSE_RANK', 'LAG', 'LEAD', 'GROUPING')
 
     def __init__(self, rtype=Function):
         self.rtype = rtype
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Connection-free SQL literals rendering.
+
+It produces the final SQL text of a built query without a database driver,
+e.g to generate migration or backfill scripts:
+
+    render_literal('SELECT * FROM users WHERE ( name = %s )', ("O'Brien", ))
+    --> "SELECT * FROM users WHERE ( name = 'O''Brien' )"
+
+NOTE: rendered strings assume standard_conforming_strings = on (the default
+since PostgreSQL 9.1), strings with backslashes are rendered as E'' literals
+"""
+import binascii
+import datetime
+import decimal
+import json
+import sys
+import uuid
+from pg_requests.operators import Param
+
+
+if sys.version_info[0] >= 3:
+    _text_type = str
+    _binary_types = (bytes, bytearray, memoryview)
+    _integer_types = (int, )
+else:  # python 2, str is text there
+    _text_type = basestring
+    _binary_types = (bytearray, buffer, memoryview)
+    _integer_types = (int, long)
+
+
+def quote_string(value):
+    """Quote text value
+
+    :param value: str
+    :rtype : str
+    """
+    if '\x00' in value:
+        raise ValueError('Strings can not contain NUL characters')
+    value = value.replace("'", "''")
+    if '\\' in value:
+        return "E'" + value.replace('\\', '\\\\') + "'"
+    return "'" + value + "'"
+
+
+def _quote_bytes(value):
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    return "'\\x" + binascii.hexlify(bytes(value)).decode('ascii') + \
+        "'::bytea"
+
+
+def _quote_bool(value):
+    return 'true' if value else 'false'
+
+
+def _quote_int(value):
+    return '%d' % value
+
+
+def _quote_float(value):
+    if value != value:
+        return "'NaN'::float8"
+    if value in (float('inf'), float('-inf')):
+        return "'%sInfinity'::float8" % ('-' if value < 0 else '')
+    return repr(float(value))
+
+
+def _quote_decimal(value):
+    if value.is_nan():
+        return "'NaN'::numeric"
+    if value.is_infinite():
+        return "'%sInfinity'::numeric" % ('-' if value < 0 else '')
+    return str(value)
+
+
+def _quote_datetime(value):
+    if value.tzinfo is not None:
+        return "'%s'::timestamptz" % value.isoformat()
+    return "'%s'::timestamp" % value.isoformat()
+
+
+def _quote_date(value):
+    return "'%s'::date" % value.isoformat()
+
+
+def _quote_time(value):
+    if value.tzinfo is not None:
+        return "'%s'::timetz" % value.isoformat()
+    return "'%s'::time" % value.isoformat()
+
+
+def _quote_timedelta(value):
+    return "'%d days %d.%06d seconds'::interval" % (
+        value.days, value.seconds, value.microseconds)
+
+
+def _quote_uuid(value):
+    return "'%s'::uuid" % value
+
+
+def _quote_list(value):
+    if not value:
+        return "'{}'"
+    return 'ARRAY[' + ', '.join([quote_literal(v) for v in value]) + ']'
+
+
+def _quote_tuple(value):
+    if not value:
+        raise ValueError('Empty tuple can not be rendered, e.g as IN (...) '
+                         'value')
+    return '(' + ', '.join([quote_literal(v) for v in value]) + ')'
+
+
+def _quote_dict(value):
+    return quote_string(json.dumps(value)) + '::jsonb'
+
+
+def _quote_none(value):
+    return 'NULL'
+
+
+def _quote_param(value):
+    raise ValueError('Unbound template parameter %r' % value)
+
+
+# NOTE: order matters for subclasses lookup, e.g bool is a subclass of int
+# and datetime is a subclass of date
+_QUOTERS = [
+    (type(None), _quote_none),
+    (_text_type, quote_string),
+    (_binary_types, _quote_bytes),
+    (bool, _quote_bool),
+    (_integer_types, _quote_int),
+    (float, _quote_float),
+    (decimal.Decimal, _quote_decimal),
+    (datetime.datetime, _quote_datetime),
+    (datetime.date, _quote_date),
+    (datetime.time, _quote_time),
+    (datetime.timedelta, _quote_timedelta),
+    (uuid.UUID, _quote_uuid),
+    (list, _quote_list),
+    (tuple, _quote_tuple),
+    (dict, _quote_dict),
+    (Param, _quote_param),
+]
+
+# Quoter by exact value type, filled on lookup
+_quoters_cache = {}
+
+
+def _get_quoter(value_type):
+    for types, quoter in _QUOTERS:
+        if issubclass(value_type, types):
+            _quoters_cache[value_type] = quoter
+            return quoter
+    raise TypeError("Can't render '%s' value as SQL literal" %
+                    value_type.__name__)
+
+
+def quote_literal(value):
+    """Render value as SQL literal
+
+    :param value: None, str, bytes, bool, int, float, Decimal, datetime, date,
+        time, timedelta, UUID, list (array), tuple (IN list), dict (jsonb)
+    :rtype : str
+    """
+    try:
+        quoter = _quoters_cache[value.__class__]
+    except KeyError:
+        quoter = _get_quoter(value.__class__)
+    return quoter(value)
+
+
+def render_literal(sql, values):
+    """Substitute values into sql as literals
+
+    :param sql: str: query with %s placeholders
+    :param values: tuple: values
+    :rtype : str
+    """
+    if not values:
+        return sql
+    return sql % tuple([quote_literal(value) for value in values])
@@ -3,7 +3,7 @@ import abc
 from collections import namedtuple
 
 
-__all__ = ['Or', 'And', 'Q', 'JOIN', 'F']
+__all__ = ['Or', 'And', 'Q', 'JOIN', 'F', 'Param']
 
 
 NOT_A_VALUE = object()
@@ -12,6 +12,9 @@ NOT_A_VALUE = object()
 class Evaluable(object):
     """Evaluable interface class. Just indicate that class has .eval() method
     """
+    # NOTE: subclasses declare __slots__ too, condition trees and tokens can
+    # consist of thousands of instances, per-instance __dict__ is expensive
+    __slots__ = ()
 
     @abc.abstractmethod
     def eval(self):
@@ -34,6 +37,9 @@ JOIN = join_t(CROSS='CROSS JOIN',
               RIGHT_OUTER='RIGHT OUTER JOIN',
               FULL_OUTER='FULL OUTER JOIN')
 
+# Parsed condition lookup key, see ConditionOperator.parse_lookup
+Lookup = namedtuple('Lookup', ['name', 'operator', 'template'])
+
 
 class Operand(Evaluable):
     """ Any {field_name} {operator} {value} object representation
@@ -41,10 +47,14 @@ class Operand(Evaluable):
         - WHERE clause
         - UPDATE .. SET a = 1 cases
     """
-    def __init__(self, name, operator, value):
+    __slots__ = ('name', 'operator', 'value', 'template')
+
+    def __init__(self, name, operator, value, template=None):
         self.name = name
         self.operator = operator
         self.value = value
+        # Prepared '{name} {operator} %s' template
+        self.template = template or '{} {} %s'.format(name, operator)
 
     # NOTE: experimental method
     def __or__(self, other):
@@ -67,11 +77,12 @@ class Operand(Evaluable):
         # We substitute field object to the template directly instead of passing it as '%s' parameters
         if isinstance(self.value, FieldObject):
             return "{} {} {}".format(self.name, self.operator, self.value.eval()), NOT_A_VALUE
-        return "{} {} %s".format(self.name, self.operator), self.value
+        return self.template, self.value
 
 
 class ConditionOperator(Evaluable):
     """ Basic operator representation"""
+    __slots__ = ('conditions', )
 
     OPERATORS = {
         'eq': '=',
@@ -83,6 +94,7 @@ class ConditionOperator(Evaluable):
         'is': 'IS',
         'is_not': 'IS NOT',
         'in': 'IN',
+        'any': '= ANY',  # value must be a list, it's adapted as an array
 
         # NOTE: Pattern matching operators
         # More info: https://www.postgresql.org/docs/9.3/static/functions-matching.html
@@ -92,6 +104,20 @@ class ConditionOperator(Evaluable):
     }
     OP_SEPARATOR = '__'
 
+    # Keyword joining conditions, e.g ' AND '. Operators with it are rendered
+    # by .render_into(), custom operators with None are evaluated with .eval()
+    SQL_OPERATOR = None
+
+    # Operators with non-default value placeholder
+    PLACEHOLDERS = {
+        'any': '(%s)',
+    }
+
+    # Memoized lookups, {lookup key: Lookup}. NOTE: the cache is shared with
+    # subclasses, override it together with OPERATORS
+    _lookups = {}
+    LOOKUP_CACHE_SIZE = 1024
+
     def __init__(self, *args, **kwargs):
         if args:
             self.conditions = args
@@ -121,46 +147,159 @@ class ConditionOperator(Evaluable):
         return tokens, values
 
     @classmethod
-    def parse_conditions(cls, conditions, result=None):
-        """Parse conditions
+    def _iter_conditions(cls, conditions):
+        """Iterate over conditions, nested lists and tuples are flattened,
+        Q objects are unpacked
 
-        :param conditions: list | tuple | dict
-        :param result:
-        :return: :raise Exception:
+        :param conditions: list | tuple | dict | ConditionOperator | Q
         """
-        if result is None:
-            result = []
-
         if isinstance(conditions, (list, tuple)):
             for cond in conditions:
-                if isinstance(cond, ConditionOperator):
-                    val = cond.eval()
-                    result.append(val)
-                else:
-                    cls.parse_conditions(cond, result)
+                for item in cls._iter_conditions(cond):
+                    yield item
+        elif isinstance(conditions, QueryObject):
+            yield conditions.condition
+        else:
+            yield conditions
 
-        elif isinstance(conditions, dict):
-            operands = cls.parse_dict_condition(conditions)
-            tokens, values = cls._expand_operands(operands)
-            result.append((tokens, values))
+    @classmethod
+    def _render_condition(cls, condition, tokens, values):
+        """Render dict condition or custom operator. Sql tokens are appended
+        to tokens, values to the shared values list
+        """
+        if isinstance(condition, dict):
+            for key, value in condition.items():
+                lookup = cls.parse_lookup(key)
+                if isinstance(value, FieldObject):
+                    # Field object is substituted to the template directly
+                    tokens.append('{} {} {}'.format(
+                        lookup.name, lookup.operator, value.eval()))
+                else:
+                    tokens.append(lookup.template)
+                    values.append(value)
+        elif isinstance(condition, ConditionOperator):
+            sql, condition_values = condition.eval()
+            tokens.append(sql)
+            values.extend(v for v in condition_values
+                          if v is not NOT_A_VALUE)
         else:
             raise Exception(
-                'Unexpected error. Debug: conditions=%s (%s), result=%s' % (
-                    conditions, type(conditions), result))
+                'Unexpected error. Debug: conditions=%s (%s)' % (
+                    condition, type(condition)))
 
+    @classmethod
+    def parse_conditions(cls, conditions):
+        """Parse conditions
+
+        :param conditions: list | tuple | dict
+        :return: ['a = %s', '( b > %s OR c < %s )', ...], [1, 2, 3, ...]
+        :raise Exception:
+        """
         tokens, values = [], []
-        for sql_str, val_list in result:
-            # Can come as a list, like ['a = %s', 'b > %s']
-            # or as a prepared string, like '( a = %s AND b > %s )' in case of
-            # nested operators
-            if isinstance(sql_str, str):
-                tokens.append(sql_str)
+        for condition in cls._iter_conditions(conditions):
+            if isinstance(condition, ConditionOperator) and \
+                    condition.SQL_OPERATOR is not None:
+                tokens.append(condition.render_into(values))
             else:
-                tokens.extend(sql_str)
-
-            values.extend(list(val_list))
+                cls._render_condition(condition, tokens, values)
         return tokens, values
 
+    def render_into(self, values):
+        """Render condition sql, values are appended to the given list.
+        Nested operators are rendered in one pass without recursion into a
+        single list of sql parts, so neither values nor sql of nested levels
+        are copied level by level and long chains like Q(a=1) | Q(a=2) | ...
+        don't hit the recursion limit
+
+        :param values: list: shared values list
+        :rtype : str
+        """
+        parts = ['( ']
+        # Stack of [joining keyword, conditions iterator, is first condition]
+        stack = [[self.SQL_OPERATOR, self._iter_conditions(
+            getattr(self, 'conditions', ())), True]]
+        while stack:
+            frame = stack[-1]
+            for condition in frame[1]:
+                if isinstance(condition, ConditionOperator) and \
+                        condition.SQL_OPERATOR is not None:
+                    if not frame[2]:
+                        parts.append(frame[0])
+                    frame[2] = False
+                    parts.append('( ')
+                    stack.append([condition.SQL_OPERATOR,
+                                  self._iter_conditions(
+                                      getattr(condition, 'conditions', ())),
+                                  True])
+                    break
+
+                tokens = []
+                self._render_condition(condition, tokens, values)
+                for token in tokens:
+                    if not frame[2]:
+                        parts.append(frame[0])
+                    frame[2] = False
+                    parts.append(token)
+            else:
+                stack.pop()
+                parts.append(' )')
+        return ''.join(parts)
+
+    def _eval(self):
+        values = []
+        return self.render_into(values), tuple(values)
+
+    @classmethod
+    def parse_lookup(cls, key):
+        """Parse lookup key into a Lookup. Results are memoized, so every
+        distinct key is split and validated only once.
+
+        Examples:
+            'a' --> Lookup(name='a', operator='=', template='a = %s')
+            'a__gte' --> Lookup(name='a', operator='>=', template='a >= %s')
+            'users__id' --> Lookup(name='users.id', operator='=', ...)
+            'users__id__in' --> Lookup(name='users.id', operator='IN', ...)
+
+        :param key: str: lookup key
+        :rtype : Lookup
+        :raise ValueError: if lookup key is wrong
+        """
+        try:
+            return cls._lookups[key]
+        except KeyError:
+            pass
+
+        keys = key.split(cls.OP_SEPARATOR)
+        op_key = 'eq'
+        if len(keys) == 1:  # equal case
+            name = keys[0]
+        elif len(keys) == 2:
+            # operator case
+            if keys[1] not in cls.OPERATORS:
+                # handle this as a "<table_name>.<field_name>"
+                table_name, field_name = keys
+                name = '%s.%s' % (table_name, field_name)
+            else:
+                name, op_key = keys
+        elif len(keys) == 3:
+            # compose the name as a "<table_name>.<field_name>"
+            table_name, field_name, op_key = keys
+            name = '%s.%s' % (table_name, field_name)
+            if op_key not in cls.OPERATORS:
+                raise ValueError("Unknown condition operator '{}' in `{}`"
+                                 .format(op_key, key))
+        else:
+            raise ValueError('Wrong condition operator in `{}`'.format(key))
+
+        operator = cls.OPERATORS[op_key]
+        placeholder = cls.PLACEHOLDERS.get(op_key, ' %s')
+        lookup = Lookup(name=name, operator=operator,
+                        template='{} {}{}'.format(name, operator, placeholder))
+        if len(cls._lookups) >= cls.LOOKUP_CACHE_SIZE:
+            cls._lookups.clear()
+        cls._lookups[key] = lookup
+        return lookup
+
     @classmethod
     def parse_dict_condition(cls, condition):
         """Parse dict condition to native operators.
@@ -174,56 +313,43 @@ class ConditionOperator(Evaluable):
         :rtype : list
         :return : list of Operands
         """
-        values = []
         operands = []
         for key, value in condition.items():
-            keys = key.split(cls.OP_SEPARATOR)
-            values.append(value)
-            if len(keys) == 1:  # equal case
-                operator = cls.OPERATORS.get('eq')
-                name = keys[0]
-            elif len(keys) == 2:
-                # operator case
-                operator = cls.OPERATORS.get(keys[1])
-                if not operator:
-                    # handle this as a "<table_name>.<field_name>"
-                    table_name, field_name = keys
-                    name = '%s.%s' % (table_name, field_name)
-                    operator = cls.OPERATORS['eq']
-                else:
-                    name = keys[0]
-            elif len(keys) == 3:
-                # compose the name as a "<table_name>.<field_name>"
-                table_name, field_name = keys[:2]
-                name = '%s.%s' % (table_name, field_name)
-                operator = cls.OPERATORS.get(keys[2])
-            else:
-                raise ValueError('Wrong condition operator in `{}: {}`'.format(
-                    key, value))
-
-            operands.append(Operand(name=name, operator=operator, value=value))
+            lookup = cls.parse_lookup(key)
+            operands.append(Operand(name=lookup.name,
+                                    operator=lookup.operator,
+                                    value=value,
+                                    template=lookup.template))
         return operands
 
+    def __or__(self, other):
+        return Or(self, getattr(other, 'condition', other))
+
+    def __and__(self, other):
+        return And(self, getattr(other, 'condition', other))
+
     def __repr__(self):
         return "%s(condition=%s)" % (self.__class__.__name__, self.conditions)
 
 
 class Or(ConditionOperator):
     """SQL OR condition operator"""
+    __slots__ = ()
+
+    SQL_OPERATOR = ' OR '
 
     def eval(self):
-        tokens, values = self.parse_conditions(self.conditions)
-        condition_str = ' OR '.join(tokens)
-        return ' '.join(['(', condition_str, ')']), tuple(values)
+        return self._eval()
 
 
 class And(ConditionOperator):
     """SQL AND condition operator"""
+    __slots__ = ()
+
+    SQL_OPERATOR = ' AND '
 
     def eval(self):
-        tokens, values = self.parse_conditions(self.conditions)
-        condition_str = ' AND '.join(tokens)
-        return ' '.join(['(', condition_str, ')']), tuple(values)
+        return self._eval()
 
 
 class QueryObject(Evaluable):
@@ -237,15 +363,16 @@ class QueryObject(Evaluable):
         qs.select('MyTable').filter(Q(a__gt=1) | Q(a__lt=10))
 
     """
+    __slots__ = ('condition', )
 
     def __init__(self, **kwargs):
         self.condition = And(kwargs)
 
     def __or__(self, other):
-        return Or(self.condition, other.condition)
+        return Or(self.condition, getattr(other, 'condition', other))
 
     def __and__(self, other):
-        return And(self.condition, other.condition)
+        return And(self.condition, getattr(other, 'condition', other))
 
     def __repr__(self):
         return "Q(%s)" % self.condition
@@ -263,6 +390,8 @@ class FieldObject(Evaluable):
 
     Where 'total' becomes an F expression
     """
+    __slots__ = ('_value', )
+
     def __init__(self, value):
         self._value = value
 
@@ -290,5 +419,22 @@ class FieldObject(Evaluable):
         return FieldObject("{} / {}".format(self.eval(), other))
 
 
+class Param(object):
+    """Named parameter placeholder of a query template. It is kept in the
+    query values as is and replaced by the actual value on binding, see
+    QueryBuilder.template()
+
+    Example:
+        qf.select('users').filter(id=Param('uid')).template().bind(uid=5)
+    """
+    __slots__ = ('name', )
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "%s(name=%s)" % (self.__class__.__name__, self.name)
+
+
 Q = QueryObject
 F = FieldObject
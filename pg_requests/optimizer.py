@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""Condition tree optimizer for And / Or / Q expressions.
+
+Optimization steps:
+    - nested operators of the same type are flattened:
+        And(And(a, b), c) --> And(a, b, c)
+    - duplicate predicates are removed
+    - OR of equalities on one column is folded into an array predicate:
+        Q(a=1) | Q(a=2) | Q(a=3) --> a = ANY(%s), ([1, 2, 3], )
+      Only values of FOLDABLE_TYPES are folded. E.g strings are not: a list
+      of strings is adapted as text[] and uuid, enum, date, etc columns
+      can't be compared with it, while 'x' literal is an untyped value
+    - empty branches (no conditions) are always true, they are removed from
+      AND and make the whole OR always true
+"""
+from collections import namedtuple
+import datetime
+import decimal
+import sys
+import uuid
+from pg_requests.operators import ConditionOperator, And, Or, QueryObject
+
+
+AND, OR = 'AND', 'OR'
+
+if sys.version_info[0] >= 3:
+    _integer_types = (int, )
+else:  # python 2
+    _integer_types = (int, long)
+
+# Value types whose arrays are adapted with the right element type
+FOLDABLE_TYPES = _integer_types + (
+    float, decimal.Decimal, bool, datetime.date, datetime.datetime, uuid.UUID)
+
+# Always true condition marker
+TRUE = object()
+
+_Node = namedtuple('_Node', ['op', 'children'])
+_Leaf = namedtuple('_Leaf', ['key', 'value'])
+
+
+def _op(condition):
+    return OR if isinstance(condition, Or) else AND
+
+
+def _normalize(condition):
+    """Convert condition into a tree of _Node and _Leaf items. Nested
+    operators of the same type are flattened on the way, it's done without
+    recursion, so long chains like Q(a=1) | Q(a=2) | ... are fine
+    """
+    if isinstance(condition, QueryObject):
+        condition = condition.condition
+    op = _op(condition)
+    children = []
+    stack = [getattr(condition, 'conditions', ())]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, QueryObject):
+            item = item.condition
+
+        if isinstance(item, dict):
+            # NOTE: items of a dict condition are joined by the enclosing
+            # operator
+            children.extend(_Leaf(key, value) for key, value in item.items())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(reversed(item))
+        elif isinstance(item, (And, Or)):
+            if _op(item) == op:
+                stack.append(getattr(item, 'conditions', ()))
+            else:
+                children.append(_normalize(item))
+        elif isinstance(item, ConditionOperator):
+            # Unknown operator, keep it as is
+            children.append(item)
+        else:
+            raise ValueError('Unexpected condition %r' % (item, ))
+    return _Node(op, children)
+
+
+def _freeze(value):
+    """Hashable representation of a value to compare predicates"""
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return 'id', id(value)
+    return type(value), value
+
+
+def _identity(item):
+    if isinstance(item, _Leaf):
+        return (ConditionOperator.parse_lookup(item.key).template,
+                _freeze(item.value))
+    if isinstance(item, _Node):
+        return item.op, tuple(_identity(child) for child in item.children)
+    return 'id', id(item)
+
+
+def _dedupe(children):
+    seen, result = set(), []
+    for child in children:
+        identity = _identity(child)
+        if identity not in seen:
+            seen.add(identity)
+            result.append(child)
+    return result
+
+
+def _fold_values(leaf):
+    """Values of a foldable leaf: equality or already folded array predicate
+
+    :return: tuple (column name, values type, list of values) or None
+    """
+    lookup = ConditionOperator.parse_lookup(leaf.key)
+    if lookup.operator == '=':
+        values = [leaf.value]
+    elif lookup.operator == '= ANY' and isinstance(leaf.value, list):
+        values = leaf.value
+    else:
+        return None
+
+    types = set(type(value) for value in values)
+    if len(types) != 1:
+        return None
+    value_type = types.pop()
+    if not issubclass(value_type, FOLDABLE_TYPES):
+        return None
+    return lookup.name, value_type, values
+
+
+def _fold_equalities(children):
+    """Fold OR-ed equalities on one column into a single = ANY(%s) leaf"""
+    groups, folded = {}, []
+    for child in children:
+        fold = _fold_values(child) if isinstance(child, _Leaf) else None
+        if fold is None:
+            folded.append(child)
+            continue
+        name, value_type, values = fold
+        group = groups.get((name, value_type))
+        if group is None:
+            # Keep position of the first predicate on the column
+            group = groups[(name, value_type)] = [name, []]
+            folded.append(group)
+        group[1].extend(values)
+
+    result = []
+    for child in folded:
+        if not isinstance(child, list):
+            result.append(child)
+            continue
+        name, values = child
+        values = _dedupe_values(values)
+        if len(values) == 1:
+            key = ConditionOperator.OP_SEPARATOR.join(name.split('.'))
+            result.append(_Leaf(key, values[0]))
+        else:
+            key = ConditionOperator.OP_SEPARATOR.join(
+                name.split('.') + ['any'])
+            result.append(_Leaf(key, values))
+    return result
+
+
+def _dedupe_values(values):
+    seen, result = set(), []
+    for value in values:
+        identity = _freeze(value)
+        if identity not in seen:
+            seen.add(identity)
+            result.append(value)
+    return result
+
+
+def _simplify(node):
+    """Simplify node
+
+    :return: _Node or TRUE
+    """
+    children = []
+    for child in node.children:
+        if isinstance(child, _Node):
+            child = _simplify(child)
+            if child is TRUE:
+                if node.op == OR:
+                    return TRUE
+                continue
+            if child.op == node.op or len(child.children) == 1:
+                children.extend(child.children)
+                continue
+        children.append(child)
+
+    children = _dedupe(children)
+    if node.op == OR:
+        children = _fold_equalities(children)
+
+    if not children:
+        return TRUE
+    if len(children) == 1 and isinstance(children[0], _Node):
+        return children[0]
+    return _Node(node.op, children)
+
+
+def _build(node):
+    cls = Or if node.op == OR else And
+    conditions = []
+    for child in node.children:
+        if isinstance(child, _Node):
+            conditions.append(_build(child))
+        elif isinstance(child, _Leaf):
+            conditions.append({child.key: child.value})
+        else:
+            conditions.append(child)
+    return cls(*conditions)
+
+
+def optimize(condition):
+    """Optimize condition tree
+
+    Usage:
+        optimize(Q(a=1) | Q(a=2) | Q(b=3)) --> Or({'a__any': [1, 2]}, {'b': 3})
+
+    :param condition: And | Or | Q | dict
+    :return: And | Or or None if the condition is always true
+    """
+    if isinstance(condition, dict):
+        condition = And(condition)
+    node = _simplify(_normalize(condition))
+    if node is TRUE:
+        return None
+    return _build(node)
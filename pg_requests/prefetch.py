@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+try:
+    from collections.abc import Mapping
+except ImportError:  # python 2
+    from collections import Mapping
+from pg_requests.query import SelectQuery
+
+
+def get_key(row, key):
+    """Get key value of a fetched row: tuple (key is index), dict-like row or
+    record/object (key is a name)
+
+    :param row: fetched row
+    :param key: str | int: column name or index
+    :return: key value
+    """
+    if isinstance(key, int) or isinstance(row, Mapping):
+        return row[key]
+    try:
+        return getattr(row, key)
+    except AttributeError:
+        # e.g psycopg2.extras.DictRow
+        return row[key]
+
+
+def prefetch(rows, table_name, local_key, foreign_key, cursor, fields=None,
+             chunk_size=1000):
+    """Fetch related rows of already fetched ones with a single query per
+    chunk of keys instead of a query per row:
+
+        SELECT * FROM {table_name} WHERE ( {foreign_key} IN %s )
+
+    Usage:
+        users = qf.select('users').fetch_records(cursor)
+        orders = qf.prefetch(users, 'orders', local_key='id',
+                             foreign_key='user_id', cursor=cursor)
+        for user in users:
+            user_orders = orders.get(user.id, [])
+
+    :param rows: iterable of fetched rows
+    :param table_name: str: related table name
+    :param local_key: str | int: key of rows
+    :param foreign_key: str: related table column
+    :param cursor: connection.cursor: instance
+    :param fields: list of str: related table fields to fetch, foreign key is
+        fetched anyway
+    :param chunk_size: int: max number of keys per query
+    :return: dict: {key: list of related records}
+    """
+    if chunk_size < 1:
+        raise ValueError('Wrong chunk size %r' % chunk_size)
+    if fields and foreign_key not in fields:
+        fields = tuple(fields) + (foreign_key, )
+
+    # Unique not null keys in the order of rows
+    keys, seen = [], set()
+    for row in rows:
+        key = get_key(row, local_key)
+        if key is None or key in seen:
+            continue
+        seen.add(key)
+        keys.append(key)
+
+    index = {}
+    for start in range(0, len(keys), chunk_size):
+        query = SelectQuery().select(table_name)
+        if fields:
+            query.fields(*fields)
+        # NOTE: IN tuple values are untyped literals, an array of strings
+        # would be text[] and couldn't be compared with e.g uuid or enum
+        query.filter(**{foreign_key + '__in':
+                        tuple(keys[start:start + chunk_size])})
+        for record in query.fetch_records(cursor):
+            index.setdefault(getattr(record, foreign_key), []).append(record)
+    return index
@@ -1,14 +1,34 @@
 # -*- coding: utf-8 -*-
-from collections import OrderedDict, Iterable
+from collections import OrderedDict
 import copy
-from pg_requests.operators import JOIN, NOT_A_VALUE
-
+import json
+import re
+try:
+    from collections.abc import Iterable
+except ImportError:  # python 2
+    from collections import Iterable
+from pg_requests.operators import JOIN, F, Param
+from pg_requests import optimizer
+from pg_requests.copy_format import CopyFrom, apply_settings
+from pg_requests.literals import render_literal
+from pg_requests.records import fetch_records
+from pg_requests.renderer import RendererMeta
+
+from pg_requests.functions import window_spec
 from pg_requests.tokens import Token, CommaValue, StringValue, \
-    FilterValue, NullValue, TupleValue, DictValue, CommaDictValue
+    FilterValue, NullValue, TupleValue, CommaDictValue, \
+    FieldsValue, JoinValue, SampleValue, SubqueryValue
+
 
+# NOTE: python 2 and 3 compatible way to declare metaclass
+_RenderedQuery = RendererMeta('_RenderedQuery', (object, ), {})
 
-class QueryBuilder(object):
-    """Basic query builder implementation class"""
+
+class QueryBuilder(_RenderedQuery):
+    """Basic query builder implementation class.
+    Every subclass gets the render function generated from its TOKENS, see
+    pg_requests.renderer
+    """
 
     # OrderedDict must use here, define tokens and templates for each new query
     # class
@@ -19,10 +39,14 @@ class QueryBuilder(object):
         # ('SELECT', Token(template='FROM {}', value_type=StringValue)),
     ])
 
+    SETTING_NAME_RE = re.compile(r'^[a-z_][a-z0-9_.]*$')
+
     def __init__(self):
         # Init tokens with templates
         # NOTE: tokens order is important
         self.tokens = copy.deepcopy(self.TOKENS)
+        # Per-query execution settings, {name: value}, see .setting()
+        self.settings = OrderedDict()
 
     def _set_token_value(self, token_name, value):
         """Token value setter
@@ -33,6 +57,19 @@ class QueryBuilder(object):
         token = self._get_token(token_name)
         token.value = value
 
+    def _add_token_value(self, token_name, value):
+        """Update token value if it is set, e.g concatenate filters or
+        append joins, set it otherwise
+
+        :param token_name: str: name of token
+        :param value: value of token
+        """
+        token = self._get_token(token_name)
+        if token.value:
+            token.value.update(value)
+        else:
+            token.value = value
+
     def _get_token(self, token_name):
         """Token getter
 
@@ -85,7 +122,8 @@ class QueryBuilder(object):
 
     @staticmethod
     def _build_query(tokens):
-        """Build query tuple
+        """Build query tuple. Generic implementation, .get_raw() uses the
+        equivalent render function generated for the class
 
         :param tokens:
         :rtype : tuple
@@ -95,7 +133,7 @@ class QueryBuilder(object):
             "INSERT INTO test (num, data) VALUES (%s, %s)", (42, 'bar')
 
         """
-        sql_str_parts, values = [], ()
+        sql_str_parts, values = [], []
         for key, token in tokens.items():
             # Skip tokens which are not set
             if not token.is_set:
@@ -111,11 +149,9 @@ class QueryBuilder(object):
                 # sql string + tuple of values
                 sql_str_parts.append(eval_result[0])
 
-                # merge values tuple
-                values += tuple(filter(lambda v: v is not NOT_A_VALUE, eval_result[1]))
+                values.extend(eval_result[1])
 
-        query = (' '.join(sql_str_parts), values)
-        return query
+        return ' '.join(sql_str_parts), tuple(values)
 
     def get_raw(self):
         """Get raw built sql
@@ -126,7 +162,109 @@ class QueryBuilder(object):
             "INSERT INTO test (num, data) VALUES (%s, %s)", (42, 'bar')
 
         """
-        return self._build_query(self.tokens)
+        return self._render(self.tokens)
+
+    def setting(self, name, value):
+        """Set run-time setting for the query execution. Settings are applied
+        with set_config(name, value, true) (the same as SET LOCAL) in the same
+        request right before the query, so they last until the end of the
+        current transaction only. In autocommit mode it's the query itself.
+        COPY statements (.copy_out(), InsertQuery.from_columns()) are sent
+        separately, they require a transaction and raise ValueError in
+        autocommit mode.
+
+        Usage:
+            qf.select('reports').setting('work_mem', '256MB').execute(cursor)
+
+        :param name: str: setting name
+        :param value: setting value
+        :return: self
+        """
+        if not self.SETTING_NAME_RE.match(name):
+            raise ValueError("Wrong setting name '%s'" % name)
+        self.settings[name] = str(value)
+        return self
+
+    def timeout(self, ms):
+        """Cancel the query if it runs longer than given milliseconds
+
+        :param ms: int: statement_timeout in milliseconds
+        :return: self
+        """
+        return self.setting('statement_timeout', int(ms))
+
+    def work_mem(self, value):
+        """Memory for query sort and hash operations
+
+        :param value: str | int: e.g '256MB' or kilobytes
+        :return: self
+        """
+        return self.setting('work_mem', value)
+
+    def max_parallel_workers(self, n):
+        """Max number of parallel workers of the query (per Gather node)
+
+        :param n: int: max_parallel_workers_per_gather value
+        :return: self
+        """
+        return self.setting('max_parallel_workers_per_gather', int(n))
+
+    def _get_settings_raw(self):
+        """Build settings query
+
+        :return: tuple: sql string, values tuple
+        """
+        sql = 'SELECT {}'.format(
+            ', '.join(['set_config(%s, %s, true)'] * len(self.settings)))
+        values = ()
+        for item in self.settings.items():
+            values += item
+        return sql, values
+
+    def _get_execution_raw(self, sql, values):
+        """Prepend execution settings to built query
+
+        :return: tuple: sql string, values tuple
+        """
+        if not self.settings:
+            return sql, values
+        settings_sql, settings_values = self._get_settings_raw()
+        return ('; '.join([settings_sql, sql]),
+                settings_values + tuple(values))
+
+    def optimize(self):
+        """Optimize already set filter conditions (WHERE, HAVING), see
+        pg_requests.optimizer. E.g OR of equalities on one column becomes
+        a single '= ANY(%s)' array predicate
+
+        Usage:
+            qf.select('users')\
+                .filter(Q(id=1) | Q(id=2) | Q(id=3))\
+                .optimize()
+
+        :return: self
+        """
+        for token in self.tokens.values():
+            if token.is_set and isinstance(token.value, FilterValue):
+                condition = optimizer.optimize(token.value.value)
+                if condition is None:
+                    token.reset()
+                else:
+                    token.value.value = condition
+        return self
+
+    def template(self):
+        """Build query once and get reusable template of it. Values which
+        are Param instances become named template parameters
+
+        Usage:
+            USER_BY_ID = qf.select('users').filter(id=Param('uid')).template()
+            ...
+            USER_BY_ID.execute(cursor, uid=5).fetchone()
+
+        :rtype : QueryTemplate
+        """
+        return QueryTemplate(*self._get_execution_raw(*self.get_raw()))
 
     def execute(self, cursor):
         """Build queryset and execute it
@@ -141,9 +279,34 @@ class QueryBuilder(object):
                         .execute(cur)\
                         .fetchall()
         """
-        cursor.execute(self.mogrify(cursor))
+        return self._execute_raw(cursor, *self.get_raw())
+
+    def _execute_raw(self, cursor, sql, values):
+        """Execute built (or wrapped built) query with execution settings
+
+        :param cursor: connection.cursor: instance
+        :param sql: str: sql template
+        :param values: tuple: values
+        :return: cursor
+        """
+        cursor.execute(cursor.mogrify(*self._get_execution_raw(sql, values)))
         return cursor
 
+    def fetch_records(self, cursor):
+        """Execute query and fetch rows as lightweight record objects.
+        Record class is generated once per column signature and cached,
+        see pg_requests.records
+
+        Usage:
+            users = qf.select('users').fields('id', 'name')\
+                .fetch_records(cursor)
+            users[0].name
+
+        :param cursor: connection.cursor: instance
+        :return: list of records
+        """
+        return fetch_records(self.execute(cursor))
+
     def mogrify(self, cursor):
         """Return a query string after arguments binding
 
@@ -152,6 +315,18 @@ class QueryBuilder(object):
         """
         return cursor.mogrify(*self.get_raw())
 
+    def render_literal(self):
+        """Render the final query text with values quoted as SQL literals,
+        it doesn't need a database connection, see pg_requests.literals
+
+        Usage:
+            qf.select('users').filter(name="O'Brien").render_literal() -->
+                "SELECT * FROM users WHERE ( name = 'O''Brien' )"
+
+        :rtype : str
+        """
+        return render_literal(*self.get_raw())
+
 
 class SelectQuery(QueryBuilder):
     """Select query builder.
@@ -163,11 +338,21 @@ class SelectQuery(QueryBuilder):
     >>> qf.select('MyTable').fields('a', 'b').filter(score__gt=0).order_by('a').desc()
     """
     TOKENS = OrderedDict([
-        ('SELECT', Token(template='SELECT {}', value_type=CommaValue,
+        ('SELECT', Token(template='SELECT', value_type=NullValue,
+                         required=True)),
+        ('SELECT__DISTINCT_ON', Token(template='DISTINCT ON ({})',
+                                      value_type=FieldsValue)),
+        ('FIELDS', Token(template='{}', value_type=FieldsValue,
                          required=True)),
         # Table tokens
         ('FROM', Token(template='FROM {}', value_type=StringValue)),
         ('FROM__ALIAS', Token(template="AS '{}' ", value_type=StringValue)),
+        ('FROM__SAMPLE', Token(template='TABLESAMPLE {}',
+                               value_type=SampleValue)),
+        ('FROM__SUBQUERY', Token(template='FROM ({})',
+                                 value_type=SubqueryValue)),
+        ('FROM__SUBQUERY_ALIAS', Token(template='AS {}',
+                                       value_type=StringValue)),
 
         # User-function tokens
         # Use sub-token to glue token str value + sub-token value without space
@@ -178,28 +363,35 @@ class SelectQuery(QueryBuilder):
         ('FROM__FN_NAME', Token(template='FROM {}', value_type=StringValue)),
         ('FROM__FN_ARGS', Token(template='({})', value_type=TupleValue)),
 
-        ('JOIN', Token(template='{join_type} {table_name}',
-                       value_type=DictValue)),
-        # NOTE: JOIN__ON and JOIN__USING mutual exclusive
-        # FIXME: JOIN__ON must be conditional type
-        ('JOIN__ON', Token(template='ON ({})', value_type=StringValue)),
-        ('JOIN__USING', Token(template='USING ({})', value_type=CommaValue)),
+        # Ordered list of joins, see JoinValue
+        ('JOIN', Token(template='{}', value_type=JoinValue)),
 
         # NOTE: here is quite complex logic, see ConditionalValue imp
         ('WHERE', Token(template='WHERE {}', value_type=FilterValue)),
 
-        ('GROUP_BY', Token(template='GROUP BY {}', value_type=CommaValue)),
+        ('GROUP_BY', Token(template='GROUP BY {}', value_type=FieldsValue)),
 
         # TODO: add tests for having
         ('GROUP_BY__HAVING', Token(template='HAVING {}', 
                                    value_type=FilterValue)),
+        ('WINDOW', Token(template='WINDOW {}', value_type=CommaValue)),
 
-        ('ORDER_BY', Token(template='ORDER BY {}', value_type=CommaValue)),
+        ('ORDER_BY', Token(template='ORDER BY {}', value_type=FieldsValue)),
         ('DESC', Token(template='DESC', value_type=NullValue)),
         ('LIMIT', Token(template='LIMIT {}', value_type=StringValue)),
         ('OFFSET', Token(template='OFFSET {}', value_type=StringValue)),
     ])
 
+    COPY_FORMATS = ('csv', 'text', 'binary')
+
+    # NOTE: json is cast to text to prevent parsing on the driver side
+    JSON_AGG_TEMPLATE = "SELECT coalesce(json_agg(t), '[]')::text FROM ({}) t"
+    JSON_ROWS_TEMPLATE = 'SELECT row_to_json(t)::text FROM ({}) t'
+
+    EXISTS_TEMPLATE = 'SELECT EXISTS({})'
+    COUNT_TEMPLATE = 'SELECT count(*) FROM ({}) t'
+    EXPLAIN_TEMPLATE = 'EXPLAIN (FORMAT JSON) {}'
+
     def fields(self, *fields):
         """Select fields to fetch
 
@@ -209,11 +401,33 @@ class SelectQuery(QueryBuilder):
 
         # Filter False parameters
         fields = list(filter(None, fields))
+        self._set_token_value('SELECT', True)
         if fields:
             # Substitute as SELECT %s, %s...
-            self._set_token_value('SELECT', fields)
+            self._set_token_value('FIELDS', fields)
         else:
-            self._set_token_value('SELECT', '*')
+            self._set_token_value('FIELDS', '*')
+        return self
+
+    def distinct_on(self, *fields):
+        """Keep only the first row of each set of rows where the given
+        expressions are equal: SELECT DISTINCT ON (...) ...
+        The first row is determined by ORDER BY, it must start with the same
+        expressions
+
+        Usage:
+            # The latest event of every device
+            qf.select('events')\
+                .distinct_on('device_id')\
+                .order_by('device_id', 'ts DESC')
+
+        :param fields: str: expressions
+        :return: self
+        """
+        fields = list(filter(None, fields))
+        if not fields:
+            raise ValueError('DISTINCT ON expressions are required')
+        self._set_token_value('SELECT__DISTINCT_ON', fields)
         return self
 
     def call_fn(self, fn_name, args):
@@ -235,10 +449,15 @@ class SelectQuery(QueryBuilder):
     def select(self, table_name, alias=None):
         """Select from a table. It means SQL FROM operator.
 
-        :param table_name: str: table name
+        :param table_name: str: table name or query builder instance for a
+            sub-query, sub-query alias is 't' by default
         :param alias: alias for a table - 'AS' keyword
         """
-        # TODO: add sub-query feature + custom frontend function
+        if hasattr(table_name, 'get_raw'):
+            # Sub-query: SELECT * FROM (SELECT ...) AS <alias>
+            self.fields('*')._set_token_value('FROM__SUBQUERY', table_name)
+            self._set_token_value('FROM__SUBQUERY_ALIAS', alias or 't')
+            return self
 
         # Set default selection fields as '*'
         sanitized_tn = self._sanitize_table_name(table_name)
@@ -249,19 +468,182 @@ class SelectQuery(QueryBuilder):
             self._set_token_value('FROM__ALIAS', alias)
         return self
 
-    def join(self, table_name, join_type=JOIN.INNER, on=None, using=None):
+    def fetch_json(self, cursor, per_row=False):
+        """Execute query and fetch the result as a JSON document built by
+        Postgres. The document is returned as raw text, it is not parsed.
+
+        Usage:
+            body = qf.select('users').fields('id', 'name').fetch_json(cursor)
+            '[{"id":1,"name":"Mr.Robot"}, ...]'
+
+            # JSON object per row, e.g for streaming of large results
+            for line in qf.select('users').fetch_json(cursor, per_row=True):
+                ...
+
+        :param cursor: connection.cursor: instance
+        :param per_row: bool: return iterator of JSON objects, a row each
+        :return: str | iterator of str
+        """
+        sql, values = self.get_raw()
+        if per_row:
+            self._execute_raw(cursor, self.JSON_ROWS_TEMPLATE.format(sql),
+                              values)
+            return (row[0] for row in cursor)
+
+        self._execute_raw(cursor, self.JSON_AGG_TEMPLATE.format(sql), values)
+        return cursor.fetchone()[0]
+
+    def exists(self, cursor):
+        """Check if the query returns any row:
+        SELECT EXISTS(... LIMIT 1)
+
+        :param cursor: connection.cursor: instance
+        :rtype : bool
+        """
+        query = self
+        if not self._get_token('LIMIT').is_set:
+            query = copy.deepcopy(self).limit(1)
+        sql, values = query.get_raw()
+        query._execute_raw(cursor, self.EXISTS_TEMPLATE.format(sql), values)
+        return bool(cursor.fetchone()[0])
+
+    def count(self, cursor, estimate=False, cap=None):
+        """Count rows of the query result
+
+        Usage:
+            qf.select('events').filter(kind='click').count(cursor)
+            # planner row estimate, no rows are scanned
+            qf.select('events').filter(kind='click').count(cursor,
+                                                           estimate=True)
+            # count at most 1000 rows, e.g to show '1000+ results'
+            qf.select('events').filter(kind='click').count(cursor, cap=1000)
+
+        :param cursor: connection.cursor: instance
+        :param estimate: bool: return the planner estimate from EXPLAIN
+        :param cap: int: count at most cap rows
+        :rtype : int
+        """
+        if estimate:
+            sql, values = self.get_raw()
+            self._execute_raw(cursor, self.EXPLAIN_TEMPLATE.format(sql),
+                              values)
+            plan = cursor.fetchone()[0]
+            # json type result can be already parsed by the driver
+            if isinstance(plan, (str, bytes)):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+        query = self
+        if cap is not None:
+            limit_token = self._get_token('LIMIT')
+            if limit_token.is_set:
+                cap = min(cap, int(limit_token.value.value))
+            query = copy.deepcopy(self).limit(cap)
+        sql, values = query.get_raw()
+        query._execute_raw(cursor, self.COUNT_TEMPLATE.format(sql), values)
+        return cursor.fetchone()[0]
+
+    def copy_out(self, cursor, fileobj, format='csv', header=False):
+        """Stream query result with COPY (...) TO STDOUT directly into a
+        file-like object. Postgres serializes the rows, so the data never
+        passes through python row tuples.
+
+        Usage:
+            with open('users.csv', 'wb') as f:
+                qf.select('users').filter(active=True).copy_out(cursor, f)
+
+        :param cursor: connection.cursor: instance
+        :param fileobj: file-like object with .write() or callable which
+            accepts chunks of data, e.g response.write
+        :param format: str: one of COPY_FORMATS
+        :param header: bool: include header line, csv format only
+        :return: cursor
+        :raise ValueError: if execution settings are set in autocommit mode,
+            COPY is a separate statement, see copy_format.apply_settings
+        """
+        if format not in self.COPY_FORMATS:
+            raise ValueError("Wrong COPY format '%s', must be one of %s" % (
+                format, self.COPY_FORMATS))
+        if header and format != 'csv':
+            raise ValueError("COPY header is only available for csv format")
+
+        options = 'FORMAT {}'.format(format)
+        if header:
+            options += ', HEADER true'
+
+        sql, values = self.get_raw()
+        # NOTE: COPY doesn't accept parameters, bind them on the client side
+        copy_sql = cursor.mogrify(
+            'COPY ({}) TO STDOUT WITH ({})'.format(sql, options), values)
+
+        if not hasattr(fileobj, 'write') and callable(fileobj):
+            fileobj = _CallableWriter(fileobj)
+        if self.settings:
+            apply_settings(cursor, self._get_settings_raw())
+        cursor.copy_expert(copy_sql, fileobj)
+        return cursor
+
+    def sample(self, percent, method='SYSTEM', seed=None):
+        """Sample the table: TABLESAMPLE {method} (percent) REPEATABLE (seed)
+
+        Usage:
+            qf.select('events').sample(1, seed=42)\
+                .fields(fn.COUNT('*')).filter(kind='click')
+
+        :param percent: float: sampling percentage, 0 - 100
+        :param method: str: 'SYSTEM' (block sampling) or 'BERNOULLI' (row
+            sampling)
+        :param seed: int: seed for repeatable sampling
+        :return: self
+        """
+        self._set_token_value('FROM__SAMPLE', dict(
+            method=method, percent=percent, seed=seed))
+        return self
+
+    def join(self, table_name, join_type=JOIN.INNER, on=None, using=None,
+             alias=None, lateral=False):
+        """Join a table or a sub-query. Multiple calls add multiple joins in
+        the given order.
+
+        Usage:
+            qf.select('users')\
+                .join('orders', alias='o', on={'o__user_id': F('users.id')})\
+                .join('customers', join_type=JOIN.LEFT_OUTER, using=('id', ))
+
+            # LATERAL sub-query
+            last_orders = qf.select('orders')\
+                .filter(user_id=F('users.id')).order_by('id').desc().limit(3)
+            qf.select('users')\
+                .join(last_orders, alias='o', lateral=True,
+                      join_type=JOIN.LEFT_OUTER)
+
+        :param table_name: str | SelectQuery: table name or sub-query
+        :param join_type: str: one of JOIN
+        :param on: str | dict | Q | ConditionOperator: ON condition
+        :param using: list of str: USING columns, mutual exclusive with 'on'
+        :param alias: str: table or sub-query alias, required for sub-query
+        :param lateral: bool: LATERAL join
+        :return: self
+        """
         if join_type not in JOIN:
             raise ValueError(
                 "Wrong join type '%r', must be '%r'" % (join_type, JOIN))
-        self._set_token_value(
-            'JOIN', dict(join_type=join_type, table_name=table_name))
+        if on is not None and using is not None:
+            raise ValueError("'on' and 'using' join options are mutual "
+                             "exclusive")
+
+        if isinstance(table_name, QueryBuilder):
+            if alias is None:
+                raise ValueError('Sub-query join requires an alias')
+        else:
+            table_name = self._sanitize_table_name(table_name)
 
-        # FIXME: JOIN__ON must be conditional type or not ???
-        if on is not None:
-            self._set_token_value('JOIN__ON', on)
-        elif using is not None:
-            self._set_token_value('JOIN__USING', using)
+        if on is not None and not isinstance(on, str):
+            on = FilterValue(on)
 
+        self._add_token_value('JOIN', dict(
+            join_type=join_type, table=table_name, alias=alias,
+            lateral=lateral, on=on, using=using))
         return self
 
     def filter(self, *args, **kwargs):
@@ -309,6 +691,15 @@ class SelectQuery(QueryBuilder):
         return self
 
     def group_by(self, *args):
+        """GROUP BY clause
+
+        Usage:
+            .group_by('region', 'city')
+            .group_by(rollup('region', 'city'))  # subtotals in one scan
+
+        :param args: str: columns or grouping elements, see
+            pg_requests.functions rollup(), cube(), grouping_sets()
+        """
         args = list(filter(None, args))
         if args:
             self._set_token_value('GROUP_BY', args)
@@ -321,6 +712,92 @@ class SelectQuery(QueryBuilder):
             self._set_token_value('GROUP_BY__HAVING', kwargs)
         return self
 
+    def window(self, name, partition_by=None, order_by=None):
+        """Define named window: WINDOW {name} AS (...).
+        Multiple calls define multiple windows
+
+        Usage:
+            qf.select('payments')\
+                .fields('id', fn.SUM('amount').over('w'))\
+                .window('w', partition_by='user_id', order_by='created_at')
+
+        :param name: str: window name
+        :param partition_by: str | list of str
+        :param order_by: str | list of str
+        :return: self
+        """
+        definition = '{} AS ({})'.format(
+            name, window_spec(partition_by, order_by))
+        token = self._get_token('WINDOW')
+        windows = list(token.value.value) if token.is_set else []
+        self._set_token_value('WINDOW', windows + [definition])
+        return self
+
+
+def top_n_per_group(table_name, group_by, order_by, n=1, fields=None,
+                    groups=None):
+    """Build query of the first n rows of every group.
+
+    n = 1 without groups query is a DISTINCT ON query:
+
+        SELECT DISTINCT ON (device_id) * FROM events
+        ORDER BY device_id, ts DESC
+
+    Otherwise it's a LATERAL join of every group key with a LIMIT n
+    sub-query, it reads only n rows per group with an index on
+    (group_by, order_by):
+
+        SELECT t.* FROM (SELECT device_id FROM events GROUP BY device_id) AS g
+        CROSS JOIN LATERAL (SELECT * FROM events
+                            WHERE ( device_id = g.device_id )
+                            ORDER BY ts DESC LIMIT 3) AS t
+
+    Usage:
+        qf.top_n_per_group('events', group_by='device_id',
+                           order_by='ts DESC', n=3)
+
+    :param table_name: str
+    :param group_by: str | list of str: group columns
+    :param order_by: str | list of str: order of rows within a group
+    :param n: int: number of rows per group
+    :param fields: list of str: fields to select, all by default
+    :param groups: SelectQuery: query of the group keys, e.g
+        qf.select('devices').fields('id AS device_id'); table_name rows are
+        grouped by default
+    :rtype : SelectQuery
+    """
+    if isinstance(group_by, str):
+        group_by = (group_by, )
+    if isinstance(order_by, str):
+        order_by = (order_by, )
+    group_by, order_by = list(group_by), list(order_by)
+    if not group_by:
+        raise ValueError('Group columns are required')
+    n = int(n)
+    if n < 1:
+        raise ValueError('Wrong number of rows per group %r' % n)
+    fields = fields or ('*', )
+
+    if n == 1 and groups is None:
+        return SelectQuery().select(table_name)\
+            .fields(*fields)\
+            .distinct_on(*group_by)\
+            .order_by(*(group_by + order_by))
+
+    if groups is None:
+        groups = SelectQuery().select(table_name)\
+            .fields(*group_by)\
+            .group_by(*group_by)
+    group_rows = SelectQuery().select(table_name)\
+        .fields(*fields)\
+        .filter(OrderedDict((column, F('g.' + column))
+                            for column in group_by))\
+        .order_by(*order_by)\
+        .limit(n)
+    return SelectQuery().select(groups, alias='g')\
+        .fields('t.*')\
+        .join(group_rows, join_type=JOIN.CROSS, alias='t', lateral=True)
+
 
 class InsertQuery(QueryBuilder):
     """Insert query builder.
@@ -375,6 +852,29 @@ class InsertQuery(QueryBuilder):
             )
         return self
 
+    def from_columns(self, columns, format=None):
+        """Bulk insert of column-oriented data with COPY FROM STDIN.
+        Columns are encoded column by column, numpy arrays of fixed width
+        types are packed in binary COPY format, see pg_requests.copy_format
+
+        Usage:
+            qf.insert('metrics')\
+                .from_columns(OrderedDict([('ts', ts_array),
+                                           ('value', value_array)]))\
+                .execute(cursor)
+
+        :param columns: dict | list of tuples: {column name: values}, values
+            are numpy arrays, array.array or lists of the same length
+        :param format: str: 'binary', 'text' or None to choose binary format
+            if all columns are numpy arrays of supported types
+        :rtype : CopyFrom
+        NOTE: execution settings require a transaction, see .setting()
+        """
+        table_name = self._get_token('INSERT').value.value
+        settings_raw = self._get_settings_raw() if self.settings else None
+        return CopyFrom(table_name, columns, format=format,
+                        settings_raw=settings_raw)
+
     def defaults(self):
         """Allows to insert row with all defaults values
         Simulate the following: INSERT INTO {table_name} DEFAULT VALUES'
@@ -457,6 +957,222 @@ class DeleteQuery(QueryBuilder):
     pass
 
 
+class UniqueIndexQuery(QueryBuilder):
+    """Unique index builder
+
+    Query example:
+
+    >>> UniqueIndexQuery().unique_index('daily_totals', 'day').execute(cursor)
+
+    """
+
+    COLUMN_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+    TOKENS = OrderedDict([
+        ('CREATE', Token(template='CREATE UNIQUE INDEX ON {}',
+                         value_type=StringValue, required=True)),
+        ('COLUMNS', Token(template='({})', value_type=CommaValue,
+                          required=True)),
+    ])
+
+    def unique_index(self, table_name, *columns):
+        """
+
+        :param table_name: str: table or materialized view name
+        :param columns: str: column names
+        :return: self
+        :raise ValueError: if columns are missing or wrong
+        """
+        if not columns:
+            raise ValueError('Unique index columns are required')
+        for column in columns:
+            if not isinstance(column, str) or \
+                    not self.COLUMN_NAME_RE.match(column):
+                raise ValueError("Wrong index column name '%s'" % (column, ))
+        self._set_table_name('CREATE', table_name)
+        self._set_token_value('COLUMNS', columns)
+        return self
+
+
+class MaterializedViewQuery(QueryBuilder):
+    """Materialized view builder. View query is a query builder, so the view
+    is defined with the same objects as live queries.
+
+    Query example:
+
+    >>> materialized_view('daily_totals')\
+        .as_(qf.select('orders')
+             .fields('day', fn.SUM('amount', alias='total'))
+             .group_by('day'))\
+        .unique_index('day')\
+        .execute(cursor)
+
+    Unique indexes are separate statements, they are executed after the view
+    is created, see .indexes
+    """
+
+    TOKENS = OrderedDict([
+        ('CREATE', Token(template='CREATE MATERIALIZED VIEW {}',
+                         value_type=StringValue, required=True)),
+        ('AS', Token(template='AS {}', value_type=SubqueryValue,
+                     required=True)),
+        ('WITH_NO_DATA', Token(template='WITH NO DATA', value_type=NullValue)),
+    ])
+
+    def __init__(self):
+        super(MaterializedViewQuery, self).__init__()
+        # UniqueIndexQuery instances
+        self.indexes = []
+
+    def materialized_view(self, name):
+        self._set_table_name('CREATE', name)
+        return self
+
+    def as_(self, query):
+        """View query
+
+        :param query: SelectQuery instance
+        :return: self
+        """
+        self._set_token_value('AS', query)
+        return self
+
+    def with_no_data(self):
+        """Create the view unpopulated, it can't be queried until refresh
+
+        :return: self
+        """
+        self._set_token_value('WITH_NO_DATA', True)
+        return self
+
+    def unique_index(self, *columns):
+        """Create unique index on the view columns, it's required for
+        REFRESH MATERIALIZED VIEW CONCURRENTLY
+
+        :param columns: str: column names
+        :return: self
+        """
+        self.indexes.append(UniqueIndexQuery().unique_index(
+            self._get_token('CREATE').value.value, *columns))
+        return self
+
+    def execute(self, cursor):
+        """Create the view and its indexes
+
+        :param cursor: connection.cursor: instance
+        :return: cursor
+        """
+        super(MaterializedViewQuery, self).execute(cursor)
+        for index in self.indexes:
+            index.execute(cursor)
+        return cursor
+
+
+class RefreshQuery(QueryBuilder):
+    """Materialized view refresh builder
+
+    Query example:
+
+    >>> refresh('daily_totals', concurrently=True).execute(cursor)
+
+    """
+
+    TOKENS = OrderedDict([
+        ('REFRESH', Token(template='REFRESH MATERIALIZED VIEW',
+                          value_type=NullValue, required=True)),
+        ('CONCURRENTLY', Token(template='CONCURRENTLY', value_type=NullValue)),
+        ('VIEW', Token(template='{}', value_type=StringValue, required=True)),
+        ('WITH_NO_DATA', Token(template='WITH NO DATA', value_type=NullValue)),
+    ])
+
+    def refresh(self, name, concurrently=False):
+        """Refresh view.
+        Concurrent refresh doesn't lock out concurrent selects, but it
+        requires a unique index on the view and the view must be populated
+
+        :param name: str: view name
+        :param concurrently: bool
+        :return: self
+        """
+        self._set_token_value('REFRESH', True)
+        self._set_table_name('VIEW', name)
+        if concurrently:
+            self._set_token_value('CONCURRENTLY', True)
+        return self
+
+    def with_no_data(self):
+        """Empty the view, it can't be queried until the next refresh
+
+        :return: self
+        """
+        if self._get_token('CONCURRENTLY').is_set:
+            raise ValueError(
+                'CONCURRENTLY and WITH NO DATA can not be used together')
+        self._set_token_value('WITH_NO_DATA', True)
+        return self
+
+
+class QueryTemplate(object):
+    """Built query with named parameters. Binding only builds a values
+    tuple, the sql string is prepared once
+    """
+
+    def __init__(self, sql, values):
+        self.sql = sql
+        # Binding slots: (param name, None) for Param, (None, value) otherwise
+        self._slots = tuple(
+            (v.name, None) if isinstance(v, Param) else (None, v)
+            for v in values)
+        self.params = frozenset(name for name, _ in self._slots if name)
+
+        # Fast path: every value is a parameter
+        self._names = None
+        if all(name for name, _ in self._slots):
+            self._names = tuple(name for name, _ in self._slots)
+
+    def bind(self, **params):
+        """Bind parameters
+
+        :return: tuple: sql string, values tuple
+        :raise ValueError: if parameters are missing or unexpected
+        """
+        if len(params) != len(self.params):
+            unexpected = set(params) - self.params
+            if unexpected:
+                raise ValueError('Unexpected query template parameters: %s' %
+                                 ', '.join(sorted(unexpected)))
+        try:
+            if self._names is not None:
+                values = tuple([params[name] for name in self._names])
+            else:
+                values = tuple([params[name] if name else value
+                                for name, value in self._slots])
+        except KeyError as err:
+            raise ValueError(
+                "Missing query template parameter '%s'" % err.args[0])
+        return self.sql, values
+
+    def execute(self, cursor, **params):
+        """Bind parameters and execute the query
+
+        :param cursor: connection.cursor: instance
+        :return: cursor
+        """
+        cursor.execute(*self.bind(**params))
+        return cursor
+
+    def __repr__(self):
+        return "%s(sql=%s, params=%s)" % (
+            self.__class__.__name__, self.sql, sorted(self.params))
+
+
+class _CallableWriter(object):
+    """File-like adapter for a callable data sink"""
+
+    def __init__(self, write):
+        self.write = write
+
+
 class QueryFacade(object):
     """Query facade. Combine all queries into the one facade
 
@@ -475,6 +1191,11 @@ class QueryFacade(object):
     def call_fn(fn_name, args):
         return SelectQuery().call_fn(fn_name, args=args)
 
+    @staticmethod
+    def top_n_per_group(table_name, group_by, order_by, n=1, **kwargs):
+        return top_n_per_group(table_name, group_by=group_by,
+                               order_by=order_by, n=n, **kwargs)
+
     @staticmethod
     def insert(table_name):
         return InsertQuery().insert(table_name)
@@ -485,4 +1206,39 @@ class QueryFacade(object):
 
     @staticmethod
     def delete(table_name):
-        raise NotImplementedError('Not implemented yet')
\ No newline at end of file
+        raise NotImplementedError('Not implemented yet')
+
+    @staticmethod
+    def materialized_view(name):
+        return MaterializedViewQuery().materialized_view(name)
+
+    @staticmethod
+    def refresh(name, concurrently=False):
+        return RefreshQuery().refresh(name, concurrently=concurrently)
+
+    @staticmethod
+    def prefetch(rows, table_name, local_key, foreign_key, cursor, **kwargs):
+        # NOTE: avoid circular import, helpers are built on top of queries
+        from pg_requests.prefetch import prefetch
+        return prefetch(rows, table_name, local_key=local_key,
+                        foreign_key=foreign_key, cursor=cursor, **kwargs)
+
+    @staticmethod
+    def router(primary, replicas=(), **kwargs):
+        from pg_requests.routing import QueryRouter
+        return QueryRouter(primary, replicas, **kwargs)
+
+    @staticmethod
+    def fanout(query, connections, **kwargs):
+        from pg_requests.fanout import fanout
+        return fanout(query, connections, **kwargs)
+
+    @staticmethod
+    def stage(rows, like, columns=None, **kwargs):
+        from pg_requests.staging import StagedRows
+        return StagedRows(rows, like=like, columns=columns, **kwargs)
+
+    @staticmethod
+    def session(cursor, **kwargs):
+        from pg_requests.session import Session
+        return Session(cursor, **kwargs)
\ No newline at end of file
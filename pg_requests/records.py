@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+
+# Record classes cache, {(column_name, ...): record class}
+_RECORD_CLASSES = {}
+
+# Cache is cleared when it grows over the limit, protects from unbounded
+# growth in case of dynamically generated column sets
+RECORD_CLASSES_LIMIT = 1024
+
+
+def record_class(columns):
+    """Get record class for the given column names.
+    Record class is a namedtuple, it is generated once per column signature
+    and cached, so rows cost the same as plain tuples but allow attribute
+    access by column name.
+
+    Invalid or duplicated column names (e.g '?column?' or two 'id' columns
+    from a join) are renamed to positional names: '_0', '_1', etc.
+
+    :param columns: tuple of str: column names
+    :return: namedtuple class
+    """
+    columns = tuple(columns)
+    try:
+        return _RECORD_CLASSES[columns]
+    except KeyError:
+        pass
+
+    if len(_RECORD_CLASSES) >= RECORD_CLASSES_LIMIT:
+        _RECORD_CLASSES.clear()
+    cls = namedtuple('Record', columns, rename=True)
+    _RECORD_CLASSES[columns] = cls
+    return cls
+
+
+def fetch_records(cursor):
+    """Fetch all rows of executed cursor as record objects
+
+    :param cursor: connection.cursor: executed cursor
+    :return: list of records
+    """
+    # cursor.description items are sequences where the first item is a name
+    cls = record_class(column[0] for column in cursor.description)
+    make = cls._make
+    return [make(row) for row in cursor.fetchall()]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Query renderer code generation.
+
+Every query builder class gets a render function generated once at class
+creation from its TOKENS ordering. The function is equivalent to
+QueryBuilder._build_query, but the way of every token evaluation is resolved
+at generation time, so there are no generic type checks on the hot path.
+
+Generated code example for FIELDS and WHERE tokens:
+
+    def render(tokens):
+        parts = []
+        values = []
+        t = tokens['FIELDS']
+        if t.is_set:
+            r = t._value.eval()
+            if r.__class__ is tuple:
+                parts.append(P0 + r[0] + S0)
+                values.extend(r[1])
+            else:
+                parts.append(P0 + r + S0)
+        t = tokens['WHERE']
+        if t.is_set:
+            parts.append(P1 + t._value.eval_into(values) + S1)
+        return ' '.join(parts), tuple(values)
+
+Parameters are collected into the single values list in one pass, condition
+values are appended to it directly, see ConditionOperator.render_into
+"""
+
+
+def _split_template(template):
+    """Split token template into prefix and suffix around the only '{}'
+
+    :return: tuple (prefix, suffix) or None if template is not that simple
+    """
+    parts = template.split('{}')
+    if len(parts) != 2:
+        return None
+    if any(ch in part for part in parts for ch in '{}'):
+        return None
+    return parts[0], parts[1]
+
+
+def _token_code(idx, token):
+    """Generate code lines to render a token, token is available as 't'
+
+    :return: tuple (list of code lines, namespace constants dict)
+    """
+    kind = token.value_type.EVAL_KIND
+    prefix, suffix = 'P%d' % idx, 'S%d' % idx
+    split = _split_template(token.template)
+
+    if token.subtoken is None and kind == 'null':
+        return (['parts.append(%s)' % prefix], {prefix: token.template})
+
+    if token.subtoken is None and split is not None and kind is not None:
+        namespace = {prefix: split[0], suffix: split[1]}
+        if kind == 'str':
+            return (['parts.append(%s + t._value.eval() + %s)' % (
+                prefix, suffix)], namespace)
+        if kind == 'pair' and hasattr(token.value_type, 'eval_into'):
+            return (['parts.append(%s + t._value.eval_into(values) + %s)' % (
+                prefix, suffix)], namespace)
+        if kind == 'pair':
+            return (['sql, vals = t._value.eval()',
+                     'parts.append(%s + sql + %s)' % (prefix, suffix),
+                     'values.extend(vals)'], namespace)
+        if kind == 'mixed':
+            return (['r = t._value.eval()',
+                     'if r.__class__ is tuple:',
+                     '    parts.append(%s + r[0] + %s)' % (prefix, suffix),
+                     '    values.extend(r[1])',
+                     'else:',
+                     '    parts.append(%s + r + %s)' % (prefix, suffix)],
+                    namespace)
+
+    # Generic evaluation: sub-tokens, complex templates, unknown value types
+    return (['r = t.eval()',
+             'if isinstance(r, tuple):',
+             '    parts.append(r[0])',
+             '    values.extend(r[1])',
+             'else:',
+             '    parts.append(r)'], {})
+
+
+def compile_renderer(tokens):
+    """Generate render function for the tokens ordering
+
+    :param tokens: OrderedDict: {token key: Token}, e.g QueryBuilder.TOKENS
+    :return: function: render(tokens) --> (sql string, values tuple)
+    """
+    namespace = {}
+    lines = ['def render(tokens):',
+             '    parts = []',
+             '    values = []']
+    for idx, (key, token) in enumerate(tokens.items()):
+        code, constants = _token_code(idx, token)
+        namespace.update(constants)
+        lines.append('    t = tokens[%r]' % key)
+        lines.append('    if t.is_set:')
+        lines.extend('        ' + line for line in code)
+    lines.append('    return " ".join(parts), tuple(values)')
+
+    source = '\n'.join(lines)
+    exec(compile(source, '<renderer>', 'exec'), namespace)
+    render = namespace['render']
+    render.source = source
+    return render
+
+
+class RendererMeta(type):
+    """Query builder metaclass, generates render function of the class"""
+
+    def __init__(cls, name, bases, attrs):
+        super(RendererMeta, cls).__init__(name, bases, attrs)
+        cls._render = staticmethod(compile_renderer(getattr(cls, 'TOKENS', {})))
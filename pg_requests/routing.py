@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+import itertools
+import threading
+import time
+from pg_requests.query import SelectQuery
+
+
+class QueryRouter(object):
+    """Read replicas router. SELECT queries are executed on replica
+    connections, all the others (INSERT, UPDATE, DELETE) on the primary one.
+
+    Usage:
+        router = QueryRouter(primary=conn, replicas=[replica_1, replica_2],
+                             sticky_window=5)
+        users = router.execute(qf.select('users')).fetchall()
+        router.execute(qf.update('users').data(name='John').filter(id=1))
+
+    Read-your-writes: for sticky_window seconds after a write all reads of
+    the same caller are executed on the primary. The caller is the current
+    thread or a routing context, e.g one per request:
+
+        context = router.context()
+        context.execute(qf.update('users').data(name='John').filter(id=1))
+        context.execute(qf.select('users'))  # primary
+        router.execute(qf.select('users'))  # replica
+
+    Replica lag: optional lag_check(connection) callable returns replica lag in
+    seconds, replicas lagging more than max_lag are skipped. Checks are cached
+    for lag_check_interval seconds, replicas whose lag_check raises are
+    skipped too. If no replica is available, reads go to the primary.
+    """
+
+    ROUND_ROBIN = 'round_robin'
+    LEAST_BUSY = 'least_busy'
+    STRATEGIES = (ROUND_ROBIN, LEAST_BUSY)
+
+    def __init__(self, primary, replicas=(), strategy=ROUND_ROBIN,
+                 sticky_window=0, lag_check=None, max_lag=None,
+                 lag_check_interval=1.0, clock=time.time):
+        if strategy not in self.STRATEGIES:
+            raise ValueError("Wrong routing strategy '%s', must be one of %s" %
+                             (strategy, self.STRATEGIES))
+        if lag_check is not None and max_lag is None:
+            raise ValueError('max_lag is required for lag_check')
+
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.sticky_window = sticky_window
+        self.lag_check = lag_check
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        # Number of queries being executed, by replica index
+        self._busy = [0] * len(self.replicas)
+        # Cached lag checks, by replica index: (checked at, is healthy)
+        self._health = {}
+        # Replica indexes being checked
+        self._checking = set()
+        # Read-your-writes state of the threads not using a context
+        self._local = _ThreadState()
+
+    @staticmethod
+    def is_read(query):
+        return isinstance(query, SelectQuery)
+
+    def _is_healthy(self, idx):
+        """Check replica lag. The check runs outside of the router lock, while
+        it runs other threads use the previous result (or skip the replica
+        on the first check). Failed checks mark the replica unhealthy
+        """
+        if self.lag_check is None:
+            return True
+
+        now = self._clock()
+        with self._lock:
+            checked_at, healthy = self._health.get(idx, (None, False))
+            if (checked_at is not None and
+                    now - checked_at < self.lag_check_interval) or \
+                    idx in self._checking:
+                return healthy
+            self._checking.add(idx)
+
+        healthy = False
+        try:
+            lag = self.lag_check(self.replicas[idx])
+            healthy = lag is not None and lag <= self.max_lag
+        except Exception:
+            # NOTE: unreachable replica, it is skipped until the next check
+            pass
+        finally:
+            with self._lock:
+                self._health[idx] = (now, healthy)
+                self._checking.discard(idx)
+        return healthy
+
+    def _is_sticky(self, state):
+        return (state.last_write is not None and
+                self._clock() - state.last_write < self.sticky_window)
+
+    def _choose_replica(self):
+        """Choose replica index or None if there is no healthy replica"""
+        healthy = [idx for idx in range(len(self.replicas))
+                   if self._is_healthy(idx)]
+        if not healthy:
+            return None
+        if self.strategy == self.LEAST_BUSY:
+            with self._lock:
+                return min(healthy, key=lambda idx: self._busy[idx])
+        return healthy[next(self._counter) % len(healthy)]
+
+    def context(self):
+        """Create routing context with its own read-your-writes window
+
+        :rtype : RoutingContext
+        """
+        return RoutingContext(self)
+
+    def connection_for(self, query, context=None):
+        """Get the connection the query would be routed to
+
+        :param query: QueryBuilder instance
+        :param context: RoutingContext, the current thread by default
+        :return: connection
+        """
+        idx = self._route(query, context or self._local)
+        return self.primary if idx is None else self.replicas[idx]
+
+    def _route(self, query, state):
+        """Route query
+
+        :param state: caller state with last_write time
+        :return: replica index or None for the primary
+        """
+        if not self.is_read(query) or self._is_sticky(state):
+            return None
+        return self._choose_replica()
+
+    def execute(self, query, primary=False, context=None):
+        """Execute query on the routed connection
+
+        :param query: QueryBuilder instance
+        :param primary: bool: force the primary connection, e.g for a
+            SELECT calling a function which modifies data
+        :param context: RoutingContext, the current thread by default
+        :return: cursor
+        """
+        state = context or self._local
+        # NOTE: routing may run lag checks, it's done without the lock
+        idx = None if primary else self._route(query, state)
+        if idx is not None:
+            with self._lock:
+                self._busy[idx] += 1
+        try:
+            connection = self.primary if idx is None else self.replicas[idx]
+            cursor = query.execute(connection.cursor())
+        finally:
+            if idx is not None:
+                with self._lock:
+                    self._busy[idx] -= 1
+
+        if not self.is_read(query) or primary:
+            self.mark_write(state)
+        return cursor
+
+    def mark_write(self, context=None):
+        """Mark a write on the primary, start read-your-writes window
+
+        :param context: RoutingContext, the current thread by default
+        """
+        (context or self._local).last_write = self._clock()
+
+
+class _ThreadState(threading.local):
+    last_write = None
+
+
+class RoutingContext(object):
+    """Caller of a router with its own read-your-writes window, see
+    QueryRouter.context()
+    """
+
+    def __init__(self, router):
+        self.router = router
+        self.last_write = None
+
+    def execute(self, query, primary=False):
+        return self.router.execute(query, primary=primary, context=self)
+
+    def connection_for(self, query):
+        return self.router.connection_for(query, context=self)
+
+    def mark_write(self):
+        self.router.mark_write(context=self)
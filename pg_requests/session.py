@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Per-session identity map of rows fetched by primary key.
+
+Usage:
+    session = qf.session(cursor)
+    user = session.get('users', 1)
+    users = session.get_many('users', [3, 1, 2])  # only 2 and 3 are fetched
+    session.execute(qf.update('users').data(name='John').filter(id=1))
+    session.get('users', 1)  # fetched again
+
+Missing keys are cached too, so repeated lookups of absent rows don't hit
+the database. Writes executed through the session invalidate cached rows of
+the written table; writes executed directly with the cursor are not
+tracked, call .invalidate() then.
+"""
+from pg_requests.query import QueryBuilder, SelectQuery
+from pg_requests.records import fetch_records
+
+
+# Cached missing row marker
+MISSING = object()
+
+# NOTE: keys are bound as IN tuple of untyped literals, an array of strings
+# would be text[] and couldn't be compared with e.g uuid or enum keys. The
+# order of requested keys is restored from the identity map
+GET_MANY_TEMPLATE = 'SELECT * FROM {table} WHERE {key} IN %s'
+
+# Table name tokens of the write queries
+_TABLE_TOKENS = ('UPDATE', 'INSERT', 'DELETE')
+
+
+class Session(object):
+    """Identity map session. It's meant to be short-lived, e.g one per
+    request, and it's not thread-safe, the same as the cursor
+    """
+
+    def __init__(self, cursor, key='id'):
+        """
+
+        :param cursor: connection.cursor: instance
+        :param key: str: primary key column name, can be overridden per
+            lookup
+        """
+        self.cursor = cursor
+        self.key = key
+        # {(table, key column): {key: record or MISSING}}
+        self._identity = {}
+
+    def _fetch(self, table_name, key, keys):
+        """Fetch rows of the given keys with a single query
+
+        :return: list of records
+        """
+        sql = GET_MANY_TEMPLATE.format(table=table_name, key=key)
+        self.cursor.execute(sql, (tuple(keys), ))
+        return fetch_records(self.cursor)
+
+    def get(self, table_name, pk, key=None):
+        """Get row by primary key
+
+        :param table_name: str
+        :param pk: primary key value
+        :param key: str: primary key column name, session key by default
+        :return: record or None if there is no such row
+        """
+        return self.get_many(table_name, [pk], key=key)[0]
+
+    def get_many(self, table_name, pks, key=None):
+        """Get rows by primary keys. Keys which are not in the identity map
+        are fetched with a single query
+
+        :param table_name: str
+        :param pks: iterable of primary key values
+        :param key: str: primary key column name, session key by default
+        :return: list of records in the order of pks, None for missing rows
+        """
+        sanitize = QueryBuilder._sanitize_table_name
+        table_name = sanitize(table_name)
+        key = sanitize(key or self.key)
+        identity = self._identity.setdefault((table_name, key), {})
+        pks = list(pks)
+
+        missing, seen = [], set()
+        for pk in pks:
+            if pk not in identity and pk not in seen:
+                seen.add(pk)
+                missing.append(pk)
+
+        if missing:
+            for record in self._fetch(table_name, key, missing):
+                identity[getattr(record, key)] = record
+            for pk in missing:
+                identity.setdefault(pk, MISSING)
+
+        result = []
+        for pk in pks:
+            record = identity[pk]
+            result.append(None if record is MISSING else record)
+        return result
+
+    @staticmethod
+    def _target_table(query):
+        """Written table name of a query
+
+        :return: str | None
+        """
+        tokens = getattr(query, 'tokens', {})
+        for name in _TABLE_TOKENS:
+            token = tokens.get(name)
+            if token is not None and token.is_set:
+                return token.value.value
+        # e.g CopyFrom or staging merge
+        return getattr(query, 'table_name', None)
+
+    def execute(self, query):
+        """Execute query with the session cursor. Cached rows of the table
+        written by the query are invalidated, all the cached rows if the
+        table is unknown
+
+        :param query: query builder instance
+        :return: query execution result, e.g cursor
+        """
+        if not isinstance(query, SelectQuery):
+            self.invalidate(self._target_table(query))
+        return query.execute(self.cursor)
+
+    def invalidate(self, table_name=None, pks=None):
+        """Invalidate cached rows
+
+        :param table_name: str: table name, all the tables if None
+        :param pks: iterable of primary keys to invalidate, all the table
+            rows if None
+        """
+        if table_name is None:
+            self._identity.clear()
+            return
+
+        table_name = QueryBuilder._sanitize_table_name(table_name)
+        for (name, _), identity in self._identity.items():
+            if name != table_name:
+                continue
+            if pks is None:
+                identity.clear()
+            else:
+                for pk in pks:
+                    identity.pop(pk, None)
+
+    def clear(self):
+        """Clear the identity map"""
+        self._identity.clear()
+
+    def __contains__(self, item):
+        """Check if (table name, pk) is cached with the session key"""
+        table_name, pk = item
+        table_name = QueryBuilder._sanitize_table_name(table_name)
+        return pk in self._identity.get((table_name, self.key), ())
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""Staging table merge pipeline for large upserts.
+
+Rows are bulk loaded with COPY into a temporary staging table, then merged
+into the target table with set-based statements instead of a query per row:
+
+    result = qf.stage(rows, like='users', columns=('id', 'name'))\
+        .merge_into('users', key=('id', ))\
+        .execute(cursor)
+    result.inserted, result.updated
+
+Merge methods:
+    - 'upsert': INSERT ... SELECT ... ON CONFLICT (key) DO UPDATE, requires a
+      unique index on the key columns
+    - 'update_insert': UPDATE ... FROM staging, then INSERT ... SELECT ...
+      WHERE NOT EXISTS, works without a unique index, but concurrent writers
+      of the same keys must be excluded by the caller (e.g with a lock)
+
+Rows whose update columns are not changed are not updated and not counted.
+Staging rows must have unique keys.
+
+The staging table is a pg_temp schema table. It's dropped after the merge,
+or with the rollback of the failed transaction (in autocommit mode it's
+dropped explicitly on errors).
+"""
+from collections import namedtuple
+from pg_requests.copy_format import CopyFrom, is_autocommit
+from pg_requests.query import QueryBuilder
+
+
+MergeResult = namedtuple('MergeResult', ['inserted', 'updated'])
+
+UPSERT = 'upsert'
+UPDATE_INSERT = 'update_insert'
+METHODS = (UPSERT, UPDATE_INSERT)
+
+# Session temporary tables schema
+TEMP_SCHEMA = 'pg_temp'
+
+
+def _columns_of(rows, columns):
+    """Convert rows to column-oriented data
+
+    :param rows: list of tuples | list of dicts | dict of columns
+    :param columns: tuple of str: column names, required for tuple rows
+    :return: list of tuples (column name, list of values)
+    """
+    if isinstance(rows, dict):
+        names = columns or tuple(rows.keys())
+        return [(name, rows[name]) for name in names]
+
+    rows = list(rows)
+    if not rows:
+        raise ValueError('Rows are required')
+    if isinstance(rows[0], dict):
+        names = columns or tuple(rows[0].keys())
+        return [(name, [row[name] for row in rows]) for name in names]
+    if not columns:
+        raise ValueError('Columns are required for tuple rows')
+    values = list(zip(*rows))
+    if len(values) != len(columns):
+        raise ValueError('Rows must have %d values (%s)' % (
+            len(columns), ', '.join(columns)))
+    return list(zip(columns, [list(column) for column in values]))
+
+
+class StagedRows(object):
+    """Rows to be loaded into a staging table"""
+
+    def __init__(self, rows, like, columns=None, format=None,
+                 staging_table=None):
+        """
+
+        :param rows: list of tuples | list of dicts | dict of columns, e.g
+            numpy arrays, see InsertQuery.from_columns
+        :param like: str: table to take column types from
+        :param columns: tuple of str: column names, required for tuple rows
+        :param format: str: COPY format, see pg_requests.copy_format
+        :param staging_table: str: temporary staging table name,
+            '_staging_{like}' by default, it's created in pg_temp schema
+        """
+        sanitize = QueryBuilder._sanitize_table_name
+        self.like = sanitize(like)
+        staging_table = sanitize(
+            staging_table or '_staging_' + self.like.replace('.', '_'))
+        if staging_table.startswith(TEMP_SCHEMA + '.'):
+            staging_table = staging_table[len(TEMP_SCHEMA) + 1:]
+        if '.' in staging_table:
+            raise ValueError("Staging table '%s' must be a temporary table "
+                             "name without schema" % staging_table)
+        # NOTE: the name is qualified, so a permanent table of the same name
+        # is never dropped or written
+        self.staging_table = TEMP_SCHEMA + '.' + staging_table
+        self.copy = CopyFrom(self.staging_table, _columns_of(rows, columns),
+                             format=format)
+        self.columns = tuple(self.copy.names)
+
+    def merge_into(self, table_name, key, update=None, method=UPSERT):
+        """Merge staged rows into the table
+
+        :param table_name: str
+        :param key: tuple of str: key columns
+        :param update: tuple of str: columns to update on existing keys, all
+            the non-key columns by default, empty tuple to insert only
+        :param method: str: one of METHODS
+        :rtype : StagingMerge
+        """
+        return StagingMerge(self, table_name, key, update=update,
+                            method=method)
+
+    def __len__(self):
+        return len(self.copy)
+
+
+class StagingMerge(object):
+    """Staging table merge statements"""
+
+    def __init__(self, staged, table_name, key, update=None, method=UPSERT):
+        if method not in METHODS:
+            raise ValueError("Wrong merge method '%s', must be one of %s" % (
+                method, METHODS))
+        if isinstance(key, str):
+            key = (key, )
+        missing = [column for column in key if column not in staged.columns]
+        if not key or missing:
+            raise ValueError('Key columns %s are not staged' % (missing, ))
+        if update is None:
+            update = [c for c in staged.columns if c not in key]
+        missing = [column for column in update
+                   if column not in staged.columns or column in key]
+        if missing:
+            raise ValueError('Wrong update columns %s' % (missing, ))
+
+        self.staged = staged
+        self.table_name = QueryBuilder._sanitize_table_name(table_name)
+        self.key = tuple(key)
+        self.update = tuple(update)
+        self.method = method
+
+    @property
+    def create_sql(self):
+        """Staging table with the column types of the 'like' table, without
+        constraints. Temporary tables are not WAL-logged
+        """
+        staged = self.staged
+        return ('DROP TABLE IF EXISTS {staging}; '
+                'CREATE TEMPORARY TABLE {staging} AS '
+                'SELECT {columns} FROM {like} WITH NO DATA'.format(
+                    staging=staged.staging_table,
+                    columns=', '.join(staged.columns), like=staged.like))
+
+    @property
+    def drop_sql(self):
+        return 'DROP TABLE IF EXISTS {}'.format(self.staged.staging_table)
+
+    def _changed(self, target, source):
+        """Condition of changed update columns"""
+        return '({}) IS DISTINCT FROM ({})'.format(
+            ', '.join('{}.{}'.format(target, c) for c in self.update),
+            ', '.join('{}.{}'.format(source, c) for c in self.update))
+
+    def upsert_sql(self):
+        """INSERT ... ON CONFLICT statement, it returns inserted and updated
+        rows count. Inserted rows are the ones with xmax = 0
+        """
+        columns = ', '.join(self.staged.columns)
+        if self.update:
+            action = 'DO UPDATE SET {} WHERE {}'.format(
+                ', '.join('{0} = EXCLUDED.{0}'.format(c) for c in self.update),
+                self._changed(self.table_name, 'EXCLUDED'))
+        else:
+            action = 'DO NOTHING'
+        return ('WITH merged AS ('
+                'INSERT INTO {table} ({columns}) '
+                'SELECT {columns} FROM {staging} '
+                'ON CONFLICT ({key}) {action} '
+                'RETURNING (xmax = 0) AS inserted) '
+                'SELECT count(*) FILTER (WHERE inserted), '
+                'count(*) FILTER (WHERE NOT inserted) FROM merged'.format(
+                    table=self.table_name, columns=columns,
+                    staging=self.staged.staging_table,
+                    key=', '.join(self.key), action=action))
+
+    def _key_match(self, target, source):
+        return ' AND '.join('{0}.{2} = {1}.{2}'.format(target, source, c)
+                            for c in self.key)
+
+    def update_sql(self):
+        """UPDATE ... FROM staging statement or None if nothing to update"""
+        if not self.update:
+            return None
+        return ('UPDATE {table} AS t SET {assignments} '
+                'FROM {staging} AS s WHERE {match} AND {changed}'.format(
+                    table=self.table_name,
+                    assignments=', '.join('{0} = s.{0}'.format(c)
+                                          for c in self.update),
+                    staging=self.staged.staging_table,
+                    match=self._key_match('t', 's'),
+                    changed=self._changed('t', 's')))
+
+    def insert_sql(self):
+        """INSERT ... WHERE NOT EXISTS statement"""
+        columns = ', '.join(self.staged.columns)
+        return ('INSERT INTO {table} ({columns}) '
+                'SELECT {source_columns} FROM {staging} AS s '
+                'WHERE NOT EXISTS ('
+                'SELECT 1 FROM {table} AS t WHERE {match})'.format(
+                    table=self.table_name, columns=columns,
+                    source_columns=', '.join('s.' + c
+                                             for c in self.staged.columns),
+                    staging=self.staged.staging_table,
+                    match=self._key_match('t', 's')))
+
+    def _merge(self, cursor):
+        self.staged.copy.execute(cursor)
+        # Fresh statistics of the staging table for the merge plan
+        cursor.execute('ANALYZE {}'.format(self.staged.staging_table))
+
+        if self.method == UPSERT:
+            cursor.execute(self.upsert_sql())
+            inserted, updated = cursor.fetchone()
+        else:
+            updated = 0
+            update_sql = self.update_sql()
+            if update_sql is not None:
+                cursor.execute(update_sql)
+                updated = cursor.rowcount
+            cursor.execute(self.insert_sql())
+            inserted = cursor.rowcount
+        return MergeResult(inserted=inserted, updated=updated)
+
+    def execute(self, cursor):
+        """Create staging table, load rows, merge them and drop the table.
+        Statements are executed in the current transaction of the cursor
+        connection
+
+        :param cursor: connection.cursor: instance
+        :rtype : MergeResult
+        """
+        cursor.execute(self.create_sql)
+        try:
+            result = self._merge(cursor)
+        except Exception:
+            # NOTE: the failed transaction is aborted, the table is dropped
+            # with its rollback. In autocommit mode the table creation is
+            # committed already
+            if is_autocommit(cursor):
+                cursor.execute(self.drop_sql)
+            raise
+        cursor.execute(self.drop_sql)
+        return result
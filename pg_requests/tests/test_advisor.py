@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import io
+import unittest
+from pg_requests import query_facade as qf, F
+from pg_requests.advisor import advise, QueryLog
+
+
+class AdvisorTest(unittest.TestCase):
+    def test_column_usage(self):
+        query = qf.select('users', alias='u')\
+            .join('orders', alias='o', on={'o.user_id': F('u.id')})\
+            .join('groups', using=('group_id', ))\
+            .filter(status='active', age__gte=18, o__kind__any=['a', 'b'])\
+            .group_by('u.country')\
+            .order_by('u.created_at DESC')
+        advice = advise([query, query])
+
+        users = advice.tables['users']
+        self.assertEqual(users.queries, 2)
+        self.assertEqual(dict(users.equality), {'status': 2})
+        self.assertEqual(dict(users.range), {'age': 2})
+        self.assertEqual(dict(users.join), {'id': 2, 'group_id': 2})
+        self.assertEqual(dict(users.group_by), {'country': 2})
+        self.assertEqual(dict(users.order_by), {'created_at': 2})
+
+        orders = advice.tables['orders']
+        self.assertEqual(dict(orders.equality), {'kind': 2})
+        self.assertEqual(dict(orders.join), {'user_id': 2})
+        self.assertEqual(dict(advice.tables['groups'].join), {'group_id': 2})
+
+    def test_indexes(self):
+        entries = [qf.select('users').filter(status='a', age__gt=1)] * 3
+        entries.append(qf.select('users').filter(status='a'))
+        entries.append(qf.select('users').filter(id=1).order_by('ts'))
+        entries.append(
+            qf.update('accounts').data(balance=0).filter(user_id=1))
+        advice = advise(entries)
+        self.assertEqual(
+            [(index.ddl, index.weight) for index in advice.indexes],
+            [('CREATE INDEX ON users (status, age)', 4),
+             ('CREATE INDEX ON users (id, ts)', 1),
+             ('CREATE INDEX ON accounts (user_id)', 1)])
+
+    def test_joined_table_index(self):
+        query = qf.select('users').join(
+            qf.select('orders').filter(user_id=F('users.id'), kind='x')
+            .limit(3), alias='o', lateral=True)
+        advice = advise([query])
+        self.assertEqual([index.ddl for index in advice.indexes],
+                         ['CREATE INDEX ON orders (kind, user_id)'])
+
+    def test_pattern_warnings(self):
+        advice = advise([
+            qf.select('users').filter(name__like='%son'),
+            qf.select('users').filter(name__like='%son'),
+            qf.select('users').filter(name__like='john%'),
+            qf.select('users').filter(id=1, email__ilike='john@example.com'),
+        ])
+        self.assertEqual(
+            [(w.column, w.operator, w.pattern, w.count)
+             for w in advice.warnings],
+            [('name', 'LIKE', '%son', 2),
+             ('email', 'ILIKE', 'john@example.com', 1)])
+
+    def test_query_log(self):
+        log = QueryLog()
+        log.record(qf.select('users').filter(name__like='%son'))
+        log.record(('SELECT * FROM users WHERE ( id = %s )', (1, )))
+        fileobj = io.StringIO()
+        log.dump(fileobj)
+        fileobj.seek(0)
+
+        loaded = QueryLog.load(fileobj)
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(loaded.entries, log.entries)
+        advice = loaded.advise()
+        self.assertEqual([index.ddl for index in advice.indexes],
+                         ['CREATE INDEX ON users (id)'])
+        self.assertEqual(len(advice.warnings), 1)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import array
+import datetime
+import struct
+import unittest
+from collections import OrderedDict
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from pg_requests import query_facade as qf
+from pg_requests import copy_format
+from pg_requests.copy_format import CopyFrom, encode_text, BINARY_HEADER, \
+    BINARY_TRAILER
+
+numpy = copy_format.numpy
+
+
+class CopyFormatTest(unittest.TestCase):
+    def test_encode_text(self):
+        payload = encode_text([
+            [1, 2, None],
+            array.array('d', [0.5, 1.0, 2.25]),
+            ['a\tb', 'c\\d\n', None],
+            [True, False, None],
+            [datetime.date(2020, 1, 2), None, bytearray(b'\x01\xff')],
+        ])
+        self.assertEqual(
+            payload,
+            b'1\t0.5\ta\\tb\tt\t2020-01-02\n'
+            b'2\t1.0\tc\\\\d\\n\tf\t\\N\n'
+            b'\\N\t2.25\t\\N\t\\N\t\\\\x01ff\n')
+        self.assertEqual(encode_text([[], []]), b'')
+
+    def test_encode_text_json(self):
+        payload = encode_text([[{'a': 1}, {'path': 'c:\\tmp'}, None]])
+        self.assertEqual(payload,
+                         b'{"a": 1}\n{"path": "c:\\\\\\\\tmp"}\n\\N\n')
+
+    def test_encode_text_arrays(self):
+        payload = encode_text([
+            [[1, 2], ['x y', None, 'q"'], [[1, 2], [3, 4]], []]])
+        self.assertEqual(
+            payload,
+            b'{"1","2"}\n'
+            b'{"x y",NULL,"q\\\\""}\n'
+            b'{{"1","2"},{"3","4"}}\n'
+            b'{}\n')
+
+    def test_copy_from(self):
+        copy = qf.insert('metrics').from_columns(
+            OrderedDict([('name', ['a', 'b']), ('value', [1, 2])]))
+        self.assertEqual(copy.format, 'text')
+        self.assertEqual(len(copy), 2)
+        self.assertEqual(
+            copy.sql, 'COPY metrics (name, value) FROM STDIN WITH (FORMAT text)')
+
+        with self.assertRaises(ValueError):
+            CopyFrom('metrics', {'a': [1, 2], 'b': [1]})
+        with self.assertRaises(ValueError):
+            CopyFrom('metrics', {})
+        with self.assertRaises(ValueError):
+            CopyFrom('metrics', {'a': [1]}, format='csv')
+
+    def test_execute(self):
+        cursor = mock.Mock()
+        payloads = []
+        cursor.copy_expert.side_effect = \
+            lambda sql, fileobj: payloads.append(fileobj.read())
+        qf.insert('metrics').timeout(1000)\
+            .from_columns([('value', [1, 2])])\
+            .execute(cursor)
+
+        cursor.execute.assert_called_once_with(
+            'SELECT set_config(%s, %s, true)', ('statement_timeout', '1000'))
+        cursor.copy_expert.assert_called_once_with(
+            'COPY metrics (value) FROM STDIN WITH (FORMAT text)', mock.ANY)
+        self.assertEqual(payloads, [b'1\n2\n'])
+
+        cursor = mock.Mock()
+        cursor.connection.autocommit = True
+        copy = qf.insert('metrics').timeout(1000)\
+            .from_columns([('value', [1, 2])])
+        with self.assertRaises(ValueError):
+            copy.execute(cursor)
+        self.assertFalse(cursor.copy_expert.called)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class NumpyCopyFormatTest(unittest.TestCase):
+    def test_binary(self):
+        ts = numpy.array(['2000-01-01T00:00:01', '2020-01-01'],
+                         dtype='datetime64[s]')
+        copy = CopyFrom('metrics', OrderedDict([
+            ('id', numpy.array([1, 2], dtype='int32')),
+            ('value', numpy.array([0.5, -1.0])),
+            ('ok', numpy.array([True, False])),
+            ('ts', ts),
+        ]))
+        self.assertEqual(copy.format, 'binary')
+
+        payload = copy.encode()
+        self.assertTrue(payload.startswith(BINARY_HEADER))
+        self.assertTrue(payload.endswith(BINARY_TRAILER))
+        row_format = '>hiiidi?iq'
+        body = payload[len(BINARY_HEADER):-len(BINARY_TRAILER)]
+        self.assertEqual(len(body), 2 * struct.calcsize(row_format))
+        self.assertEqual(
+            list(struct.iter_unpack(row_format, body)),
+            [(4, 4, 1, 8, 0.5, 1, True, 8, 1000000),
+             (4, 4, 2, 8, -1.0, 1, False, 8, 631152000000000)])
+
+    def test_text_fallback(self):
+        columns = OrderedDict([
+            ('value', numpy.array([1.5, float('nan')])),
+            ('ts', numpy.array(['2020-01-01', 'NaT'], dtype='datetime64[D]')),
+            ('ok', numpy.array([True, False])),
+        ])
+        copy = CopyFrom('metrics', columns)
+        self.assertEqual(copy.format, 'text')
+        self.assertEqual(copy.encode(),
+                         b'1.5\t2020-01-01\tt\nnan\t\\N\tf\n')
+
+        with self.assertRaises(ValueError):
+            CopyFrom('metrics', {'name': numpy.array(['a'])},
+                     format='binary').encode()
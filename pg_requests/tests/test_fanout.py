@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from pg_requests import query_facade as qf
+from pg_requests.fanout import parse_order_by, merge
+
+
+class FakeCursor(object):
+    def __init__(self, rows, description=(('id', 23), ('ts', 23))):
+        self.rows = rows
+        self.description = description
+        self.executed = []
+
+    def mogrify(self, sql, values):
+        return sql, values
+
+    def execute(self, query):
+        self.executed.append(query)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+def fake_connection(rows):
+    connection = mock.Mock()
+    connection.cursor.return_value = FakeCursor(rows)
+    return connection
+
+
+class FanoutTest(unittest.TestCase):
+    def test_parse_order_by(self):
+        query = qf.select('events').order_by('events.ts', 'id DESC', 'a ASC')
+        self.assertEqual(parse_order_by(query),
+                         [('events.ts', False, False), ('id', True, True),
+                          ('a', False, False)])
+        query.desc()
+        self.assertEqual(parse_order_by(query)[-1], ('a', True, True))
+        self.assertEqual(parse_order_by(qf.select('events')), [])
+
+    def test_parse_order_by_nulls(self):
+        query = qf.select('events').order_by(
+            'ts DESC NULLS LAST', 'id nulls first', 'a ASC NULLS FIRST')
+        self.assertEqual(parse_order_by(query),
+                         [('ts', True, False), ('id', False, True),
+                          ('a', False, True)])
+
+        for item in ('lower(name) DESC', 'ts USING >', 'ts DESC NULLS',
+                     'ts NULLS LAST DESC'):
+            with self.assertRaises(ValueError):
+                parse_order_by(qf.select('events').order_by(item))
+
+    def test_merge(self):
+        cursors = [FakeCursor([(1, 1), (3, 3), (6, None)]),
+                   FakeCursor([]),
+                   FakeCursor([(2, 2), (4, 3), (5, 5)])]
+        rows = list(merge(cursors, [('ts', False, False),
+                                    ('id', True, True)]))
+        self.assertEqual(rows, [(1, 1), (2, 2), (4, 3), (3, 3), (5, 5),
+                                (6, None)])
+
+    def test_merge_nulls(self):
+        # ts DESC NULLS LAST, shards return rows in this order too
+        description = (('ts', 23), )
+        cursors = [FakeCursor([(3, ), (1, ), (None, )], description),
+                   FakeCursor([(2, ), (None, ), (None, )], description)]
+        rows = list(merge(cursors, [('ts', True, False)]))
+        self.assertEqual(rows, [(3, ), (2, ), (1, ), (None, ), (None, ),
+                                (None, )])
+
+    def test_merge_without_order(self):
+        cursors = [FakeCursor([(1, 1)]), FakeCursor([(0, 0)])]
+        self.assertEqual(list(merge(cursors, [])), [(1, 1), (0, 0)])
+
+    def test_merge_wrong_column(self):
+        with self.assertRaises(ValueError):
+            list(merge([FakeCursor([(1, 1)])], [('name', False, False)]))
+
+    def test_fanout(self):
+        connections = [
+            fake_connection([(1, 10), (2, 8), (3, 1)]),
+            fake_connection([(4, 9), (5, 7), (6, 6)]),
+        ]
+        query = qf.select('events').fields('id', 'ts').filter(kind='click')\
+            .order_by('ts').desc().limit(3).offset(1)
+        rows = list(qf.fanout(query, connections))
+        self.assertEqual(rows, [(4, 9), (2, 8), (5, 7)])
+
+        # Shards get limit + offset without offset, source query is unchanged
+        for connection in connections:
+            self.assertEqual(
+                connection.cursor.return_value.executed,
+                [('SELECT id, ts FROM events WHERE ( kind = %s ) '
+                  'ORDER BY ts DESC LIMIT 4', ('click', ))])
+        self.assertTrue(query.get_raw()[0].endswith('LIMIT 3 OFFSET 1'))
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+import copy
 import unittest
-from pg_requests.functions import fn, Function
+from pg_requests import query_facade as qf
+from pg_requests.functions import fn, Function, rollup, cube, grouping_sets
+from pg_requests.operators import Q
 
 
 class FunctionFactoryTest(unittest.TestCase):
@@ -15,3 +18,96 @@ class FunctionFactoryTest(unittest.TestCase):
         self.assertEqual(fn.MAX('x', alias='max_x'), "MAX(x) AS 'max_x'")
         self.assertEqual(fn.MAX('x', alias='alias with space'),
                          "MAX(x) AS 'alias with space'")
+
+    def test_function_is_string(self):
+        f = fn.SUM('x', alias='total')
+        self.assertIsInstance(f, str)
+        self.assertEqual(f.eval(), "SUM(x) AS 'total'")
+
+
+class WindowFunctionTest(unittest.TestCase):
+    def test_over(self):
+        self.assertEqual(fn.ROW_NUMBER().over(), 'ROW_NUMBER() OVER ()')
+        self.assertEqual(
+            fn.ROW_NUMBER().over(partition_by='user_id',
+                                 order_by=['created_at', 'id DESC']),
+            'ROW_NUMBER() OVER (PARTITION BY user_id '
+            'ORDER BY created_at, id DESC)')
+        self.assertEqual(fn.SUM('amount', alias='running').over('w'),
+                         "SUM(amount) OVER w AS 'running'")
+
+    def test_filter(self):
+        f = fn.SUM('amount').filter(status='paid')
+        self.assertEqual(f, 'SUM(amount) FILTER (WHERE ( status = %s ))')
+        self.assertEqual(f.eval(), (str(f), ('paid', )))
+
+        # Chained filters are concatenated with AND, original is not changed
+        f2 = f.filter(Q(amount__gt=10)).over(partition_by='user_id')
+        self.assertEqual(
+            f2.eval(),
+            ('SUM(amount) FILTER (WHERE ( ( status = %s ) AND '
+             '( amount > %s ) )) OVER (PARTITION BY user_id)',
+             ('paid', 10)))
+        self.assertEqual(f.values, ('paid', ))
+
+    def test_filter_values_in_clauses(self):
+        paid = fn.SUM('amount').filter(status='paid')
+        sql, values = qf.select('payments')\
+            .fields('user_id', fn.COUNT('*').filter(status='new'))\
+            .filter(amount__gt=0)\
+            .group_by('user_id')\
+            .having(id__gt=1)\
+            .order_by(paid)\
+            .get_raw()
+        self.assertEqual(
+            sql, 'SELECT user_id, COUNT(*) FILTER (WHERE ( status = %s )) '
+                 'FROM payments WHERE ( amount > %s ) GROUP BY user_id '
+                 'HAVING ( id > %s ) '
+                 'ORDER BY SUM(amount) FILTER (WHERE ( status = %s ))')
+        self.assertEqual(values, ('new', 0, 1, 'paid'))
+
+        # Parameters can't be lost in the other clauses
+        with self.assertRaises(ValueError):
+            fn.ROW_NUMBER().over(order_by=[paid])
+        with self.assertRaises(ValueError):
+            qf.insert('payments').data(amount=1).returning(paid)
+
+    def test_copy(self):
+        f = fn.COUNT('*').filter(status='paid')
+        f_copy = copy.deepcopy(f)
+        self.assertEqual(f_copy, f)
+        self.assertEqual(f_copy.values, ('paid', ))
+
+
+class GroupingTest(unittest.TestCase):
+    def test_rollup_cube(self):
+        self.assertEqual(rollup('region', 'city'), 'ROLLUP (region, city)')
+        self.assertEqual(rollup('region', ('city', 'street')),
+                         'ROLLUP (region, (city, street))')
+        self.assertEqual(cube('region', 'product'), 'CUBE (region, product)')
+        with self.assertRaises(ValueError):
+            rollup()
+
+    def test_grouping_sets(self):
+        self.assertEqual(grouping_sets(('region', 'city'), 'region', ()),
+                         'GROUPING SETS ((region, city), region, ())')
+        self.assertEqual(grouping_sets(rollup('a', 'b'), cube('c')),
+                         'GROUPING SETS (ROLLUP (a, b), CUBE (c))')
+
+    def test_group_by(self):
+        sql, values = qf.select('sales')\
+            .fields('region', 'city', fn.SUM('amount', alias='total'),
+                    fn.GROUPING('region', 'city', alias='level'))\
+            .filter(year=2016)\
+            .group_by(rollup('region', 'city'))\
+            .get_raw()
+        self.assertEqual(
+            sql, "SELECT region, city, SUM(amount) AS 'total', "
+                 "GROUPING(region, city) AS 'level' FROM sales "
+                 "WHERE ( year = %s ) GROUP BY ROLLUP (region, city)")
+        self.assertEqual(values, (2016, ))
+
+        sql, _ = qf.select('sales').fields('region', 'product')\
+            .group_by('year', cube('region', 'product')).get_raw()
+        self.assertTrue(sql.endswith(
+            'GROUP BY year, CUBE (region, product)'), sql)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import datetime
+import decimal
+import unittest
+import uuid
+from pg_requests import query_facade as qf, Param
+from pg_requests.literals import quote_literal, render_literal
+
+
+class UTC(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+
+class LiteralsTest(unittest.TestCase):
+    def test_strings(self):
+        self.assertEqual(quote_literal('abc'), "'abc'")
+        self.assertEqual(quote_literal("O'Brien"), "'O''Brien'")
+        self.assertEqual(quote_literal("a\\b'"), "E'a\\\\b'''")
+        self.assertEqual(quote_literal(u'тест'), u"'тест'")
+        with self.assertRaises(ValueError):
+            quote_literal('a\x00b')
+
+    def test_binary(self):
+        self.assertEqual(quote_literal(bytearray(b'\x00\xffa')),
+                         "'\\x00ff61'::bytea")
+        self.assertEqual(quote_literal(memoryview(b'\x01')),
+                         "'\\x01'::bytea")
+
+    def test_numbers(self):
+        self.assertEqual(quote_literal(True), 'true')
+        self.assertEqual(quote_literal(False), 'false')
+        self.assertEqual(quote_literal(None), 'NULL')
+        self.assertEqual(quote_literal(-42), '-42')
+        self.assertEqual(quote_literal(0.1), '0.1')
+        self.assertEqual(quote_literal(float('nan')), "'NaN'::float8")
+        self.assertEqual(quote_literal(float('-inf')), "'-Infinity'::float8")
+        self.assertEqual(quote_literal(decimal.Decimal('1.50')), '1.50')
+        self.assertEqual(quote_literal(decimal.Decimal('NaN')),
+                         "'NaN'::numeric")
+
+    def test_dates(self):
+        self.assertEqual(
+            quote_literal(datetime.datetime(2020, 1, 2, 3, 4, 5)),
+            "'2020-01-02T03:04:05'::timestamp")
+        self.assertEqual(
+            quote_literal(datetime.datetime(2020, 1, 2, tzinfo=UTC())),
+            "'2020-01-02T00:00:00+00:00'::timestamptz")
+        self.assertEqual(quote_literal(datetime.date(2020, 1, 2)),
+                         "'2020-01-02'::date")
+        self.assertEqual(quote_literal(datetime.time(3, 4, 5, 6)),
+                         "'03:04:05.000006'::time")
+        self.assertEqual(
+            quote_literal(datetime.timedelta(days=-1, seconds=30)),
+            "'-1 days 30.000000 seconds'::interval")
+
+    def test_containers(self):
+        value = uuid.UUID('12345678123456781234567812345678')
+        self.assertEqual(quote_literal(value),
+                         "'12345678-1234-5678-1234-567812345678'::uuid")
+        self.assertEqual(quote_literal([1, 'a', None]), "ARRAY[1, 'a', NULL]")
+        self.assertEqual(quote_literal([[1], [2]]), 'ARRAY[ARRAY[1], ARRAY[2]]')
+        self.assertEqual(quote_literal([]), "'{}'")
+        self.assertEqual(quote_literal((1, 'a')), "(1, 'a')")
+        self.assertEqual(quote_literal({'a': "b'c"}),
+                         '\'{"a": "b\'\'c"}\'::jsonb')
+        with self.assertRaises(ValueError):
+            quote_literal(())
+
+    def test_wrong_values(self):
+        with self.assertRaises(ValueError):
+            quote_literal(Param('uid'))
+        with self.assertRaises(TypeError):
+            quote_literal(object())
+
+    def test_render_literal(self):
+        self.assertEqual(render_literal('SELECT 1', ()), 'SELECT 1')
+        self.assertEqual(
+            render_literal('SELECT * FROM users WHERE ( id IN %s AND '
+                           'tags = ANY(%s) )', ((1, 2), ['a'])),
+            "SELECT * FROM users WHERE ( id IN (1, 2) AND "
+            "tags = ANY(ARRAY['a']) )")
+        self.assertEqual(
+            qf.select('users').filter(name="O'Brien").render_literal(),
+            "SELECT * FROM users WHERE ( name = 'O''Brien' )")
+        self.assertEqual(
+            qf.update('users').data(payload={'a': 1}).filter(id=1)
+            .render_literal(),
+            'UPDATE users SET payload = \'{"a": 1}\'::jsonb '
+            'WHERE ( id = 1 )')
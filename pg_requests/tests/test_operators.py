@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import unittest
-from pg_requests.operators import Or, And, Q, F
+import copy
+from pg_requests.operators import Or, And, Q, F, ConditionOperator, Lookup, \
+    Operand, Param
 
 
 class OperatorsTest(unittest.TestCase):
@@ -98,6 +100,77 @@ class OperatorsTest(unittest.TestCase):
         for v in expected_values:
             self.assertIn(v, expected_values)
 
+    def test_long_condition_chain(self):
+        n = 5000
+        condition = Q(a=0)
+        for i in range(1, n):
+            condition = condition | Q(a=i)
+        sql, values = condition.eval()
+        self.assertEqual(values, tuple(range(n)))
+        self.assertTrue(sql.startswith('( ' * (n - 1) + '( a = %s ) OR '))
+        self.assertEqual(sql.count('a = %s'), n)
+
+    def test_nested_conditions_values_order(self):
+        condition = And(Or({'a': 1}, And({'b': 2}, [{'c': 3}])),
+                        {'d': F('e')}, Q(f=4))
+        self.assertEqual(
+            condition.eval(),
+            ('( ( a = %s OR ( b = %s AND c = %s ) ) AND d = e AND '
+             '( f = %s ) )', (1, 2, 3, 4)))
+        self.assertEqual(
+            ConditionOperator.parse_conditions([{'a': 1}, Or({'b': 2})]),
+            (['a = %s', '( b = %s )'], [1, 2]))
+
+    def test_compact_instances(self):
+        operand = ConditionOperator.parse_dict_condition({'a__gt': 1})[0]
+        condition = Q(a=1) | Q(b=2)
+        for obj in (operand, condition, Q(a=1), F('a'), Param('a'),
+                    Operand('a', '=', 1)):
+            self.assertFalse(hasattr(obj, '__dict__'), obj)
+
+        condition_copy = copy.deepcopy(condition)
+        self.assertEqual(condition_copy.eval(), condition.eval())
+
+
+class LookupTest(unittest.TestCase):
+    def test_parse_lookup(self):
+        self.assertEqual(ConditionOperator.parse_lookup('a'),
+                         Lookup(name='a', operator='=', template='a = %s'))
+        self.assertEqual(ConditionOperator.parse_lookup('a__is_not'),
+                         Lookup(name='a', operator='IS NOT',
+                                template='a IS NOT %s'))
+        self.assertEqual(ConditionOperator.parse_lookup('users__id'),
+                         Lookup(name='users.id', operator='=',
+                                template='users.id = %s'))
+        self.assertEqual(ConditionOperator.parse_lookup('users__id__gte'),
+                         Lookup(name='users.id', operator='>=',
+                                template='users.id >= %s'))
+
+    def test_any_operator(self):
+        self.assertEqual(And({'users__id__any': [1, 2]}).eval(),
+                         ('( users.id = ANY(%s) )', ([1, 2], )))
+
+    def test_parse_lookup_is_memoized(self):
+        lookup = ConditionOperator.parse_lookup('users__login__ilike')
+        self.assertIs(ConditionOperator.parse_lookup('users__login__ilike'),
+                      lookup)
+        self.assertIs(And.parse_lookup('users__login__ilike'), lookup)
+
+    def test_parse_lookup_cache_is_bounded(self):
+        for i in range(ConditionOperator.LOOKUP_CACHE_SIZE + 1):
+            ConditionOperator.parse_lookup('field_%d' % i)
+        self.assertLessEqual(len(ConditionOperator._lookups),
+                             ConditionOperator.LOOKUP_CACHE_SIZE)
+
+    def test_wrong_lookup(self):
+        with self.assertRaises(ValueError) as err:
+            And({'users__login__unknown': 1}).eval()
+        self.assertIn("Unknown condition operator 'unknown'",
+                      str(err.exception))
+
+        with self.assertRaises(ValueError):
+            ConditionOperator.parse_lookup('a__b__c__d')
+
 
 class QueryObjectTest(unittest.TestCase):
     def test_or(self):
@@ -126,6 +199,15 @@ class QueryObjectTest(unittest.TestCase):
         )
         self.assertIn(res, expected)
 
+    def test_chained_operators(self):
+        res = (Q(a=1) | Q(a=2) | Q(a=3)).eval()
+        self.assertEqual(
+            res, ('( ( ( a = %s ) OR ( a = %s ) ) OR ( a = %s ) )', (1, 2, 3)))
+        res = (Q(a=1) & Q(b=2) & Q(c=3)).eval()
+        self.assertEqual(
+            res,
+            ('( ( ( a = %s ) AND ( b = %s ) ) AND ( c = %s ) )', (1, 2, 3)))
+
 
 class FieldExpressionTest(unittest.TestCase):
     def test_basic(self):
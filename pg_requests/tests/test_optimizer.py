@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import unittest
+from pg_requests import query_facade as qf
+from pg_requests.operators import And, Or, Q, F
+from pg_requests.optimizer import optimize
+
+
+class OptimizerTest(unittest.TestCase):
+    def test_flatten_nested_operators(self):
+        condition = And(And({'a': 1}), And({'b': 2}, And({'c__gt': 3})))
+        self.assertEqual(optimize(condition).eval(),
+                         ('( a = %s AND b = %s AND c > %s )', (1, 2, 3)))
+
+    def test_remove_duplicates(self):
+        condition = And({'a': 1}, {'a__eq': 1}, {'b': [1, 2]}, {'b': [1, 2]},
+                        {'c': 1}, {'c': True})
+        self.assertEqual(
+            optimize(condition).eval(),
+            ('( a = %s AND b = %s AND c = %s AND c = %s )',
+             (1, [1, 2], 1, True)))
+
+    def test_fold_or_equalities(self):
+        condition = Q(a=1) | Q(b=2) | Q(a=2) | Q(a=1) | Q(users__a=3)
+        self.assertEqual(
+            optimize(condition).eval(),
+            ('( a = ANY(%s) OR b = %s OR users.a = %s )', ([1, 2], 2, 3)))
+
+    def test_fold_long_chain(self):
+        condition = Q(id=0)
+        for i in range(1, 3000):
+            condition = condition | Q(id=i)
+        self.assertEqual(optimize(condition).eval(),
+                         ('( id = ANY(%s) )', (list(range(3000)), )))
+
+    def test_not_foldable_predicates(self):
+        field = F('b')
+        condition = Q(a=field) | Q(a=None) | Q(a__gt=1) | Q(a=1) | Q(a='1')
+        sql, values = optimize(condition).eval()
+        self.assertEqual(
+            sql, '( a = b OR a = %s OR a > %s OR a = %s OR a = %s )')
+
+        # Strings are not folded, text[] can't be compared with e.g uuid
+        self.assertEqual(
+            optimize(Q(a='x') | Q(a='y') | Q(b=1) | Q(b=2)).eval(),
+            ('( a = %s OR a = %s OR b = ANY(%s) )', ('x', 'y', [1, 2])))
+
+        # AND of equalities is not folded
+        self.assertEqual(optimize(And({'a': 1}, {'a': 2})).eval(),
+                         ('( a = %s AND a = %s )', (1, 2)))
+
+    def test_empty_branches(self):
+        self.assertIsNone(optimize(And()))
+        self.assertIsNone(optimize(Or(And(), {'a': 1})))
+        self.assertEqual(optimize(And(Or(), {'a': 1})).eval(),
+                         ('( a = %s )', (1, )))
+
+    def test_query_optimize(self):
+        query = qf.select('users')\
+            .filter(Q(id=1) | Q(id=2) | Q(id=3))\
+            .filter(name='John')\
+            .optimize()
+        self.assertEqual(
+            query.get_raw(),
+            ('SELECT * FROM users WHERE ( id = ANY(%s) AND name = %s )',
+             ([1, 2, 3], 'John')))
+
+        query = qf.update('users').data(name='John').filter(And()).optimize()
+        self.assertEqual(query.get_raw(),
+                         ('UPDATE users SET name = %s', ('John', )))
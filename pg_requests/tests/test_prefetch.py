@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import unittest
+from collections import namedtuple
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from pg_requests import query_facade as qf
+from pg_requests.prefetch import get_key
+
+
+User = namedtuple('User', ['id', 'name'])
+
+
+class PrefetchTest(unittest.TestCase):
+    def setUp(self):
+        self.cursor = mock.Mock()
+        self.cursor.description = (('id', 23), ('user_id', 23))
+        self.cursor.execute.side_effect = self._execute
+        self.cursor.mogrify.side_effect = lambda sql, values: (sql, values)
+        self.executed = []
+
+    def _execute(self, query):
+        sql, values = query
+        self.executed.append(query)
+        # Emulate related rows: two orders per user
+        self.cursor.fetchall.return_value = [
+            (user_id * 10 + i, user_id)
+            for user_id in values[0] for i in range(2)]
+
+    def test_get_key(self):
+        self.assertEqual(get_key((1, 'John'), 0), 1)
+        self.assertEqual(get_key({'id': 1}, 'id'), 1)
+        self.assertEqual(get_key(User(1, 'John'), 'id'), 1)
+
+    def test_prefetch(self):
+        users = [User(1, 'John'), User(2, 'Jane'), User(1, 'John'),
+                 User(None, 'Nobody')]
+        orders = qf.prefetch(users, 'orders', local_key='id',
+                             foreign_key='user_id', cursor=self.cursor)
+        self.assertEqual(
+            self.executed,
+            [('SELECT * FROM orders WHERE ( user_id IN %s )', ((1, 2), ))])
+        self.assertEqual(sorted(orders), [1, 2])
+        self.assertEqual([o.id for o in orders[2]], [20, 21])
+
+    def test_prefetch_in_chunks(self):
+        users = [{'id': i} for i in range(5)]
+        orders = qf.prefetch(users, 'orders', local_key='id',
+                             foreign_key='user_id', cursor=self.cursor,
+                             fields=('id', ), chunk_size=2)
+        self.assertEqual(
+            [values for _, values in self.executed],
+            [((0, 1), ), ((2, 3), ), ((4, ), )])
+        self.assertTrue(self.executed[0][0].startswith(
+            'SELECT id, user_id FROM orders'))
+        self.assertEqual(len(orders), 5)
+
+    def test_prefetch_string_keys(self):
+        # e.g uuid keys are fetched as strings
+        self.cursor.execute.side_effect = self.executed.append
+        self.cursor.fetchall.return_value = [(1, 'a1'), (2, 'b2')]
+        users = [{'id': 'a1'}, {'id': 'b2'}]
+        orders = qf.prefetch(users, 'orders', local_key='id',
+                             foreign_key='user_id', cursor=self.cursor)
+        self.assertEqual(
+            self.executed,
+            [('SELECT * FROM orders WHERE ( user_id IN %s )',
+              (('a1', 'b2'), ))])
+        self.assertEqual(sorted(orders), ['a1', 'b2'])
+
+    def test_prefetch_without_rows(self):
+        orders = qf.prefetch([], 'orders', local_key='id',
+                             foreign_key='user_id', cursor=self.cursor)
+        self.assertEqual(orders, {})
+        self.assertFalse(self.cursor.execute.called)
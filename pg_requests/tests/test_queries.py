@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
+import io
 import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 from pg_requests import query_facade as qf
 from pg_requests.functions import fn
-from pg_requests.operators import And, Q, JOIN, F
+from pg_requests.operators import And, Q, JOIN, F, Param
 
 
 class BaseQueryBuilderTest(unittest.TestCase):
@@ -78,6 +83,158 @@ class SelectQueryTest(unittest.TestCase):
                     ('Mr.Robot',))
         self.assertEqual(query, expected)
 
+    def test_multiple_joins(self):
+        query = qf.select('users')\
+            .join('orders', alias='o',
+                  on={'o__user_id': F('users.id'), 'o__status': 'paid'})\
+            .join('customers', join_type=JOIN.LEFT_OUTER, using=('id', ))\
+            .join('accounts', on='accounts.id = users.account_id')\
+            .filter(users__name='Mr.Robot')\
+            .get_raw()
+        expected_sets = (
+            ('SELECT * FROM users INNER JOIN orders AS o ON '
+             '( o.user_id = users.id AND o.status = %s ) '
+             'LEFT OUTER JOIN customers USING (id) '
+             'INNER JOIN accounts ON (accounts.id = users.account_id) '
+             'WHERE ( users.name = %s )', ('paid', 'Mr.Robot')),
+            ('SELECT * FROM users INNER JOIN orders AS o ON '
+             '( o.status = %s AND o.user_id = users.id ) '
+             'LEFT OUTER JOIN customers USING (id) '
+             'INNER JOIN accounts ON (accounts.id = users.account_id) '
+             'WHERE ( users.name = %s )', ('paid', 'Mr.Robot')),
+        )
+        self.assertIn(query, expected_sets)
+
+    def test_lateral_join(self):
+        last_orders = qf.select('orders')\
+            .filter(user_id=F('users.id'), amount__gt=10)\
+            .order_by('id').desc().limit(3)
+        query = qf.select('users')\
+            .join(last_orders, alias='o', join_type=JOIN.LEFT_OUTER,
+                  lateral=True)\
+            .filter(users__name='Mr.Robot')\
+            .get_raw()
+        sql, values = query
+        self.assertTrue(sql.startswith(
+            'SELECT * FROM users LEFT OUTER JOIN LATERAL (SELECT * FROM '
+            'orders WHERE ( '), sql)
+        self.assertTrue(sql.endswith(
+            ' ) ORDER BY id DESC LIMIT 3) AS o ON true '
+            'WHERE ( users.name = %s )'), sql)
+        self.assertIn('user_id = users.id', sql)
+        self.assertEqual(values, (10, 'Mr.Robot'))
+
+        sql, _ = qf.select('users')\
+            .join(last_orders, alias='o', join_type=JOIN.CROSS, lateral=True)\
+            .get_raw()
+        self.assertNotIn('ON true', sql)
+
+    def test_wrong_join_options(self):
+        with self.assertRaises(ValueError):
+            qf.select('users').join('orders', join_type='JOIN')
+        with self.assertRaises(ValueError):
+            qf.select('users').join('orders', on='a = b', using=('id', ))
+        with self.assertRaises(ValueError):
+            qf.select('users').join(qf.select('orders'))
+        with self.assertRaises(ValueError):
+            qf.select('users').join('orders; DROP TABLE users')
+
+    def test_select_with_table_sample(self):
+        query = qf.select('events')\
+            .fields(fn.COUNT('*'))\
+            .sample(1.5, seed=42)\
+            .join('users', using=('user_id', ))\
+            .filter(kind='click')\
+            .get_raw()
+        expected = (
+            'SELECT COUNT(*) FROM events TABLESAMPLE SYSTEM (%s) '
+            'REPEATABLE (%s) INNER JOIN users USING (user_id) '
+            'WHERE ( kind = %s )', (1.5, 42, 'click'))
+        self.assertEqual(query, expected)
+
+        query = qf.select('events').sample(10, method='BERNOULLI').get_raw()
+        self.assertEqual(
+            query,
+            ('SELECT * FROM events TABLESAMPLE BERNOULLI (%s)', (10, )))
+
+        with self.assertRaises(ValueError):
+            qf.select('events').sample(10, method='RANDOM')
+
+    def test_select_distinct_on(self):
+        query = qf.select('events')\
+            .fields('device_id', 'ts', 'value')\
+            .distinct_on('device_id')\
+            .filter(kind='temp')\
+            .order_by('device_id', 'ts DESC')
+        self.assertEqual(
+            query.get_raw(),
+            ('SELECT DISTINCT ON (device_id) device_id, ts, value FROM events '
+             'WHERE ( kind = %s ) ORDER BY device_id, ts DESC', ('temp', )))
+        with self.assertRaises(ValueError):
+            qf.select('events').distinct_on()
+
+    def test_select_from_subquery(self):
+        totals = qf.select('orders').fields('user_id', fn.SUM('amount'))\
+            .filter(status='paid').group_by('user_id')
+        self.assertEqual(
+            qf.select(totals, alias='s').filter(user_id=1).get_raw(),
+            ('SELECT * FROM (SELECT user_id, SUM(amount) FROM orders '
+             'WHERE ( status = %s ) GROUP BY user_id) AS s '
+             'WHERE ( user_id = %s )', ('paid', 1)))
+        self.assertEqual(qf.select(qf.select('a')).get_raw(),
+                         ('SELECT * FROM (SELECT * FROM a) AS t', ()))
+
+    def test_top_n_per_group(self):
+        self.assertEqual(
+            qf.top_n_per_group('events', group_by='device_id',
+                               order_by='ts DESC').get_raw(),
+            ('SELECT DISTINCT ON (device_id) * FROM events '
+             'ORDER BY device_id, ts DESC', ()))
+
+        query = qf.top_n_per_group('events', group_by=('tenant_id', 'device_id'),
+                                   order_by=['ts DESC'], n=3,
+                                   fields=['device_id', 'ts'])
+        self.assertEqual(
+            query.filter(t__ts__gt=5).get_raw(),
+            ('SELECT t.* FROM (SELECT tenant_id, device_id FROM events '
+             'GROUP BY tenant_id, device_id) AS g CROSS JOIN LATERAL '
+             '(SELECT device_id, ts FROM events WHERE ( tenant_id = '
+             'g.tenant_id AND device_id = g.device_id ) ORDER BY ts DESC '
+             'LIMIT 3) AS t WHERE ( t.ts > %s )', (5, )))
+
+        devices = qf.select('devices').fields('id AS device_id')\
+            .filter(active=True)
+        self.assertEqual(
+            qf.top_n_per_group('events', group_by='device_id',
+                               order_by='ts DESC', n=2,
+                               groups=devices).get_raw(),
+            ('SELECT t.* FROM (SELECT id AS device_id FROM devices '
+             'WHERE ( active = %s )) AS g CROSS JOIN LATERAL (SELECT * FROM '
+             'events WHERE ( device_id = g.device_id ) ORDER BY ts DESC '
+             'LIMIT 2) AS t', (True, )))
+
+        # Groups query is honoured for n = 1 too
+        self.assertEqual(
+            qf.top_n_per_group('events', group_by='device_id',
+                               order_by='ts DESC', groups=devices).get_raw(),
+            ('SELECT t.* FROM (SELECT id AS device_id FROM devices '
+             'WHERE ( active = %s )) AS g CROSS JOIN LATERAL (SELECT * FROM '
+             'events WHERE ( device_id = g.device_id ) ORDER BY ts DESC '
+             'LIMIT 1) AS t', (True, )))
+
+        # n is normalized
+        self.assertEqual(
+            qf.top_n_per_group('events', group_by='device_id',
+                               order_by='ts DESC', n='1').get_raw(),
+            ('SELECT DISTINCT ON (device_id) * FROM events '
+             'ORDER BY device_id, ts DESC', ()))
+
+        with self.assertRaises(ValueError):
+            qf.top_n_per_group('events', group_by=(), order_by='ts')
+        with self.assertRaises(ValueError):
+            qf.top_n_per_group('events', group_by='device_id', order_by='ts',
+                               n=0)
+
     def test_select_with_agg_functions(self):
         raw_query = qf.select('users')\
             .fields(fn.COUNT('*'))\
@@ -128,6 +285,218 @@ class SelectQueryTest(unittest.TestCase):
             "HAVING ( cnt >= %s )", ('Mr.Robot', 4,))
         self.assertEqual(query, expected)
 
+    def test_select_with_window_and_filter_functions(self):
+        query = qf.select('payments')\
+            .fields('id',
+                    fn.SUM('amount').filter(status='paid'),
+                    fn.SUM('amount', alias='running').over('w'),
+                    fn.RANK().over('w'))\
+            .filter(user_id=1)\
+            .window('w', partition_by='user_id', order_by='created_at')\
+            .window('w2', order_by='id')\
+            .get_raw()
+        expected = (
+            "SELECT id, SUM(amount) FILTER (WHERE ( status = %s )), "
+            "SUM(amount) OVER w AS 'running', RANK() OVER w FROM payments "
+            "WHERE ( user_id = %s ) "
+            "WINDOW w AS (PARTITION BY user_id ORDER BY created_at), "
+            "w2 AS (ORDER BY id)", ('paid', 1))
+        self.assertEqual(query, expected)
+
+    def test_fetch_json(self):
+        cursor = mock.Mock()
+        cursor.mogrify.side_effect = lambda sql, values: (sql, values)
+        cursor.fetchone.return_value = ('[{"id": 1}]', )
+        result = qf.select('users').fields('id').filter(name='Mr.Robot')\
+            .fetch_json(cursor)
+        self.assertEqual(result, '[{"id": 1}]')
+        cursor.execute.assert_called_once_with((
+            "SELECT coalesce(json_agg(t), '[]')::text FROM "
+            "(SELECT id FROM users WHERE ( name = %s )) t", ('Mr.Robot', )))
+
+    def test_fetch_json_per_row(self):
+        cursor = mock.MagicMock()
+        cursor.mogrify.side_effect = lambda sql, values: (sql, values)
+        cursor.__iter__.return_value = iter([('{"id": 1}', ), ('{"id": 2}', )])
+        result = qf.select('users').timeout(100).fetch_json(cursor,
+                                                            per_row=True)
+        cursor.execute.assert_called_once_with((
+            'SELECT set_config(%s, %s, true); '
+            'SELECT row_to_json(t)::text FROM (SELECT * FROM users) t',
+            ('statement_timeout', '100')))
+        self.assertEqual(list(result), ['{"id": 1}', '{"id": 2}'])
+
+    def test_exists(self):
+        cursor = mock.Mock()
+        cursor.mogrify.side_effect = lambda sql, values: (sql, values)
+        cursor.fetchone.return_value = (True, )
+        query = qf.select('users').filter(name='Mr.Robot')
+        self.assertTrue(query.exists(cursor))
+        cursor.execute.assert_called_once_with((
+            'SELECT EXISTS(SELECT * FROM users WHERE ( name = %s ) LIMIT 1)',
+            ('Mr.Robot', )))
+        # Source query is not changed
+        self.assertNotIn('LIMIT', query.get_raw()[0])
+
+        cursor.reset_mock()
+        query.limit(0).offset(10).exists(cursor)
+        cursor.execute.assert_called_once_with((
+            'SELECT EXISTS(SELECT * FROM users WHERE ( name = %s ) LIMIT 0 '
+            'OFFSET 10)', ('Mr.Robot', )))
+
+    def test_count(self):
+        cursor = mock.Mock()
+        cursor.mogrify.side_effect = lambda sql, values: (sql, values)
+        cursor.fetchone.return_value = (42, )
+        query = qf.select('users').filter(name='Mr.Robot')
+        self.assertEqual(query.count(cursor), 42)
+        cursor.execute.assert_called_once_with((
+            'SELECT count(*) FROM (SELECT * FROM users WHERE '
+            '( name = %s )) t', ('Mr.Robot', )))
+
+        cursor.reset_mock()
+        query.count(cursor, cap=1000)
+        cursor.execute.assert_called_once_with((
+            'SELECT count(*) FROM (SELECT * FROM users WHERE '
+            '( name = %s ) LIMIT 1000) t', ('Mr.Robot', )))
+
+        cursor.reset_mock()
+        query.limit(10).count(cursor, cap=1000)
+        self.assertIn('LIMIT 10)', cursor.execute.call_args[0][0][0])
+
+    def test_count_estimate(self):
+        cursor = mock.Mock()
+        cursor.mogrify.side_effect = lambda sql, values: (sql, values)
+        cursor.fetchone.return_value = ('[{"Plan": {"Plan Rows": 1234}}]', )
+        query = qf.select('users').filter(name='Mr.Robot')
+        self.assertEqual(query.count(cursor, estimate=True), 1234)
+        cursor.execute.assert_called_once_with((
+            'EXPLAIN (FORMAT JSON) SELECT * FROM users WHERE ( name = %s )',
+            ('Mr.Robot', )))
+
+        # Already parsed json
+        cursor.fetchone.return_value = ([{'Plan': {'Plan Rows': 7.0}}], )
+        self.assertEqual(query.count(cursor, estimate=True), 7)
+
+    def test_copy_out(self):
+        cursor = mock.Mock()
+        fileobj = io.BytesIO()
+        qf.select('users').fields('id', 'name').filter(name='Mr.Robot')\
+            .copy_out(cursor, fileobj, header=True)
+        cursor.mogrify.assert_called_once_with(
+            'COPY (SELECT id, name FROM users WHERE ( name = %s )) '
+            'TO STDOUT WITH (FORMAT csv, HEADER true)', ('Mr.Robot',))
+        cursor.copy_expert.assert_called_once_with(
+            cursor.mogrify.return_value, fileobj)
+
+    def test_copy_out_with_callable_sink(self):
+        cursor = mock.Mock()
+        chunks = []
+        qf.select('users').copy_out(cursor, chunks.append, format='binary')
+        cursor.mogrify.assert_called_once_with(
+            'COPY (SELECT * FROM users) TO STDOUT WITH (FORMAT binary)', ())
+        writer = cursor.copy_expert.call_args[0][1]
+        writer.write(b'chunk')
+        self.assertEqual(chunks, [b'chunk'])
+
+    def test_copy_out_wrong_options(self):
+        cursor = mock.Mock()
+        with self.assertRaises(ValueError):
+            qf.select('users').copy_out(cursor, io.BytesIO(), format='xml')
+        with self.assertRaises(ValueError):
+            qf.select('users').copy_out(
+                cursor, io.BytesIO(), format='text', header=True)
+        self.assertFalse(cursor.copy_expert.called)
+
+
+class QueryTemplateTest(unittest.TestCase):
+    def test_bind(self):
+        tpl = qf.select('users').filter(id=Param('uid')).template()
+        self.assertEqual(tpl.params, frozenset(['uid']))
+        self.assertEqual(tpl.bind(uid=5),
+                         ('SELECT * FROM users WHERE ( id = %s )', (5,)))
+        self.assertEqual(tpl.bind(uid=6)[1], (6,))
+
+    def test_bind_with_constant_values(self):
+        tpl = qf.select('users')\
+            .filter(name='Mr.Robot')\
+            .filter(visits__gte=Param('visits'))\
+            .template()
+        self.assertEqual(
+            tpl.bind(visits=3),
+            ('SELECT * FROM users WHERE ( ( name = %s ) AND '
+             '( visits >= %s ) )', ('Mr.Robot', 3)))
+
+    def test_bind_wrong_params(self):
+        tpl = qf.update('users').data(name=Param('name'))\
+            .filter(id=Param('uid')).template()
+        with self.assertRaises(ValueError) as err:
+            tpl.bind(uid=1)
+        self.assertIn("Missing query template parameter 'name'",
+                      str(err.exception))
+        with self.assertRaises(ValueError) as err:
+            tpl.bind(uid=1, name='John', login='john')
+        self.assertIn('login', str(err.exception))
+
+    def test_execute(self):
+        cursor = mock.Mock()
+        tpl = qf.insert('users').data(name=Param('name')).template()
+        self.assertIs(tpl.execute(cursor, name='John'), cursor)
+        cursor.execute.assert_called_once_with(
+            'INSERT INTO users (name) VALUES (%s)', ('John',))
+
+
+class QuerySettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.cursor = mock.Mock()
+        self.cursor.mogrify.side_effect = lambda sql, values: (sql, values)
+
+    def test_execute_with_settings(self):
+        qf.select('reports').filter(year=2016)\
+            .timeout(5000).work_mem('256MB').max_parallel_workers(4)\
+            .execute(self.cursor)
+        self.cursor.execute.assert_called_once_with((
+            'SELECT set_config(%s, %s, true), set_config(%s, %s, true), '
+            'set_config(%s, %s, true); '
+            'SELECT * FROM reports WHERE ( year = %s )',
+            ('statement_timeout', '5000', 'work_mem', '256MB',
+             'max_parallel_workers_per_gather', '4', 2016)))
+
+    def test_execute_without_settings(self):
+        qf.select('reports').execute(self.cursor)
+        self.cursor.execute.assert_called_once_with(
+            ('SELECT * FROM reports', ()))
+
+    def test_template_with_settings(self):
+        tpl = qf.select('reports').filter(id=Param('id'))\
+            .setting('statement_timeout', '1s').template()
+        self.assertEqual(tpl.bind(id=1), (
+            'SELECT set_config(%s, %s, true); '
+            'SELECT * FROM reports WHERE ( id = %s )',
+            ('statement_timeout', '1s', 1)))
+
+    def test_copy_out_with_settings(self):
+        qf.select('reports').work_mem('1GB').copy_out(self.cursor, io.BytesIO())
+        self.cursor.execute.assert_called_once_with(
+            'SELECT set_config(%s, %s, true)', ('work_mem', '1GB'))
+        self.assertTrue(self.cursor.copy_expert.called)
+
+    def test_copy_out_settings_autocommit(self):
+        # Settings would be reset before COPY in autocommit mode
+        self.cursor.connection.autocommit = True
+        with self.assertRaises(ValueError):
+            qf.select('reports').work_mem('1GB')\
+                .copy_out(self.cursor, io.BytesIO())
+        self.assertFalse(self.cursor.copy_expert.called)
+
+        # Settings are not required
+        qf.select('reports').copy_out(self.cursor, io.BytesIO())
+        self.assertTrue(self.cursor.copy_expert.called)
+
+    def test_wrong_setting_name(self):
+        with self.assertRaises(ValueError):
+            qf.select('reports').setting("work_mem'; --", 1)
+
 
 class InsertQueryTest(unittest.TestCase):
     def test_insert_single_row(self):
@@ -199,6 +568,68 @@ class UpdateQueryTest(unittest.TestCase):
             ('customers.value', 'customers.id'))
         self.assertEqual(query, expected)
 
+    def test_binary_values_are_not_copied(self):
+        blob, view = b'\x00' * 1024, memoryview(bytearray(b'\x01' * 1024))
+        query = qf.update('files').data(content=blob)\
+            .filter(checksum=view).get_raw()
+        self.assertIs(query[1][0], blob)
+        self.assertIs(query[1][1], view)
+
     def test_update_using_f_object(self):
         query = qf.update('users').data(count=F('count') + 1).filter(name='John').get_raw()
         self.assertEqual(query, ('UPDATE users SET count = count + 1 WHERE ( name = %s )', ('John',)))
+
+
+class MaterializedViewQueryTest(unittest.TestCase):
+    def test_create_materialized_view(self):
+        totals = qf.select('orders')\
+            .fields('day', fn.SUM('amount', alias='total'))\
+            .filter(status='paid')\
+            .group_by('day')
+        query = qf.materialized_view('daily_totals').as_(totals)
+        self.assertEqual(
+            query.get_raw(),
+            ("CREATE MATERIALIZED VIEW daily_totals AS SELECT day, "
+             "SUM(amount) AS 'total' FROM orders WHERE ( status = %s ) "
+             "GROUP BY day", ('paid', )))
+
+        query.with_no_data().unique_index('day')
+        self.assertEqual(
+            query.get_raw()[0],
+            "CREATE MATERIALIZED VIEW daily_totals AS SELECT day, "
+            "SUM(amount) AS 'total' FROM orders WHERE ( status = %s ) "
+            "GROUP BY day WITH NO DATA")
+        self.assertEqual(
+            [index.get_raw() for index in query.indexes],
+            [('CREATE UNIQUE INDEX ON daily_totals (day)', ())])
+
+        # The index is created with a separate statement after the view
+        cursor = mock.Mock()
+        cursor.mogrify.side_effect = lambda sql, values: sql
+        query.execute(cursor)
+        self.assertEqual(
+            [c[0][0] for c in cursor.execute.call_args_list][1:],
+            ['CREATE UNIQUE INDEX ON daily_totals (day)'])
+
+    def test_wrong_materialized_view(self):
+        with self.assertRaises(ValueError):
+            qf.materialized_view('daily totals')
+        with self.assertRaises(ValueError):
+            qf.materialized_view('daily_totals').as_('SELECT 1')
+        with self.assertRaises(ValueError):
+            qf.materialized_view('daily_totals').unique_index()
+        with self.assertRaises(ValueError):
+            qf.materialized_view('daily_totals')\
+                .unique_index('day);DROP TABLE orders;--')
+
+    def test_refresh(self):
+        self.assertEqual(qf.refresh('daily_totals').get_raw(),
+                         ('REFRESH MATERIALIZED VIEW daily_totals', ()))
+        self.assertEqual(
+            qf.refresh('daily_totals', concurrently=True).get_raw(),
+            ('REFRESH MATERIALIZED VIEW CONCURRENTLY daily_totals', ()))
+        self.assertEqual(
+            qf.refresh('daily_totals').with_no_data().get_raw(),
+            ('REFRESH MATERIALIZED VIEW daily_totals WITH NO DATA', ()))
+        with self.assertRaises(ValueError):
+            qf.refresh('daily_totals', concurrently=True).with_no_data()
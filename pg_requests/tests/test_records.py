@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from pg_requests import query_facade as qf
+from pg_requests.records import record_class, fetch_records
+
+
+class RecordsTest(unittest.TestCase):
+    def test_record_class_is_cached(self):
+        cls = record_class(('id', 'name'))
+        self.assertIs(record_class(['id', 'name']), cls)
+        self.assertIsNot(record_class(('id', 'login')), cls)
+
+        record = cls(1, 'Mr.Robot')
+        self.assertEqual(record.name, 'Mr.Robot')
+        self.assertEqual(record, (1, 'Mr.Robot'))
+        # No per-instance dict. NOTE: python 2 namedtuple has __dict__
+        # property, so check slots
+        self.assertEqual(cls.__slots__, ())
+
+    def test_record_class_with_invalid_names(self):
+        cls = record_class(('id', 'id', '?column?'))
+        self.assertEqual(cls._fields, ('id', '_1', '_2'))
+
+    def test_fetch_records(self):
+        cursor = mock.Mock()
+        cursor.description = (('id', 23), ('name', 1043))
+        cursor.fetchall.return_value = [(1, 'Mr.Robot'), (2, 'John')]
+        records = fetch_records(cursor)
+        self.assertEqual([r.name for r in records], ['Mr.Robot', 'John'])
+        self.assertIs(type(records[0]), type(records[1]))
+
+    def test_query_fetch_records(self):
+        cursor = mock.Mock()
+        cursor.description = (('id', 23), )
+        cursor.fetchall.return_value = [(1, )]
+        records = qf.select('users').fields('id').fetch_records(cursor)
+        self.assertTrue(cursor.execute.called)
+        self.assertEqual(records[0].id, 1)
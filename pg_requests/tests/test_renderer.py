@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import unittest
+from collections import OrderedDict
+from pg_requests import query_facade as qf
+from pg_requests.functions import fn
+from pg_requests.operators import JOIN, F, Q
+from pg_requests.query import QueryBuilder, SelectQuery
+from pg_requests.renderer import compile_renderer
+from pg_requests.tokens import Token, StringValue, DictValue, NullValue, \
+    TupleValue
+
+
+class RendererTest(unittest.TestCase):
+    def test_render_equals_generic_build(self):
+        queries = [
+            qf.select('users'),
+            qf.select('users', alias='u').fields('id', fn.COUNT('*'))
+              .filter(Q(name='John') | Q(login='john'))
+              .join('customers', join_type=JOIN.LEFT_OUTER, using=('id', ))
+              .group_by('id').having(cnt__gt=1)
+              .order_by('id').desc().limit(10).offset(5),
+            qf.select('payments')
+              .fields(fn.SUM('amount').filter(status='paid'))
+              .window('w', partition_by='user_id'),
+            qf.call_fn('my_fn', args=(1, 'a')),
+            qf.insert('users').data(name='John').returning('id'),
+            qf.insert('users').defaults(),
+            qf.update('users').data(count=F('count') + 1).filter(id=1),
+        ]
+        for query in queries:
+            self.assertEqual(query.get_raw(),
+                             query._build_query(query.tokens))
+
+    def test_render_is_generated_per_class(self):
+        self.assertIsNot(SelectQuery._render, QueryBuilder._render)
+        self.assertIn("tokens['WHERE']", SelectQuery._render.source)
+        self.assertNotIn("tokens['WHERE']", QueryBuilder._render.source)
+
+    def test_compile_renderer_generic_tokens(self):
+        tokens = OrderedDict([
+            ('JOIN', Token(template='{join_type} {table_name}',
+                           value_type=DictValue)),
+            ('FN', Token(template='FROM {}', value_type=StringValue,
+                         subtoken=Token(template='({})',
+                                        value_type=TupleValue))),
+            ('DEFAULT', Token(template='DEFAULT VALUES', value_type=NullValue)),
+            ('UNSET', Token(template='LIMIT {}', value_type=StringValue)),
+        ])
+        render = compile_renderer(tokens)
+        self.assertEqual(render(tokens), ('', ()))
+
+        tokens['JOIN'].value = dict(join_type='INNER JOIN', table_name='a')
+        tokens['FN'].value = 'my_fn'
+        tokens['FN'].subtoken.value = (1, 2)
+        tokens['DEFAULT'].value = True
+        self.assertEqual(
+            render(tokens),
+            ('INNER JOIN a FROM my_fn(%s, %s) DEFAULT VALUES', (1, 2)))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from pg_requests import query_facade as qf
+from pg_requests.routing import QueryRouter
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class QueryRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.primary = mock.Mock(name='primary')
+        self.replicas = [mock.Mock(name='replica_1'),
+                         mock.Mock(name='replica_2')]
+        self.clock = FakeClock()
+        self.select = qf.select('users')
+        self.update = qf.update('users').data(name='John').filter(id=1)
+
+    def test_round_robin(self):
+        router = qf.router(self.primary, self.replicas, clock=self.clock)
+        self.assertIsInstance(router, QueryRouter)
+        connections = [router.connection_for(self.select) for _ in range(4)]
+        self.assertEqual(connections, self.replicas * 2)
+        self.assertIs(router.connection_for(self.update), self.primary)
+        self.assertIs(qf.router(self.primary).connection_for(self.select),
+                      self.primary)
+
+    def test_execute(self):
+        router = QueryRouter(self.primary, self.replicas, clock=self.clock)
+        cursor = router.execute(self.select)
+        self.assertIs(cursor, self.replicas[0].cursor.return_value)
+        self.assertTrue(cursor.execute.called)
+
+        cursor = router.execute(self.update)
+        self.assertIs(cursor, self.primary.cursor.return_value)
+
+    def test_read_your_writes(self):
+        router = QueryRouter(self.primary, self.replicas, sticky_window=5,
+                             clock=self.clock)
+        router.execute(self.update)
+        self.clock.now = 4.9
+        self.assertIs(router.connection_for(self.select), self.primary)
+        self.clock.now = 5.0
+        self.assertIs(router.connection_for(self.select), self.replicas[0])
+
+        router.execute(self.select, primary=True)
+        self.assertIs(router.connection_for(self.select), self.primary)
+
+    def test_read_your_writes_scope(self):
+        router = QueryRouter(self.primary, self.replicas, sticky_window=5,
+                             clock=self.clock)
+        # A write in another thread doesn't pin reads of this one
+        thread = threading.Thread(target=router.execute, args=(self.update, ))
+        thread.start()
+        thread.join()
+        self.assertIs(router.connection_for(self.select), self.replicas[0])
+
+        # A write in a context pins reads of that context only
+        context, other = router.context(), router.context()
+        cursor = context.execute(self.update)
+        self.assertIs(cursor, self.primary.cursor.return_value)
+        self.assertIs(context.connection_for(self.select), self.primary)
+        self.assertIsNot(other.connection_for(self.select), self.primary)
+        self.assertIsNot(router.connection_for(self.select), self.primary)
+
+        router.mark_write()
+        self.assertIs(router.connection_for(self.select), self.primary)
+
+    def test_least_busy(self):
+        router = QueryRouter(self.primary, self.replicas,
+                             strategy=QueryRouter.LEAST_BUSY,
+                             clock=self.clock)
+        router._busy = [3, 1]
+        self.assertIs(router.connection_for(self.select), self.replicas[1])
+
+        # Busy counters are released after execution
+        router._busy = [0, 0]
+        router.execute(self.select)
+        self.assertEqual(router._busy, [0, 0])
+
+    def test_lag_check(self):
+        lags = {id(self.replicas[0]): 10, id(self.replicas[1]): 0.5}
+        lag_check = mock.Mock(side_effect=lambda conn: lags[id(conn)])
+        router = QueryRouter(self.primary, self.replicas, lag_check=lag_check,
+                             max_lag=1, lag_check_interval=2,
+                             clock=self.clock)
+        for _ in range(3):
+            self.assertIs(router.connection_for(self.select), self.replicas[1])
+        # Lag checks are cached
+        self.assertEqual(lag_check.call_count, 2)
+
+        lags[id(self.replicas[1])] = 5
+        self.clock.now = 2
+        self.assertIs(router.connection_for(self.select), self.primary)
+        self.assertEqual(lag_check.call_count, 4)
+
+    def test_lag_check_failure(self):
+        def lag_check(conn):
+            # Checks run without the router lock
+            self.assertFalse(router._lock.locked())
+            if conn is self.replicas[0]:
+                raise RuntimeError('connection refused')
+            return 0
+
+        router = QueryRouter(self.primary, self.replicas, lag_check=lag_check,
+                             max_lag=1, clock=self.clock)
+        cursor = router.execute(self.select)
+        self.assertIs(cursor, self.replicas[1].cursor.return_value)
+        self.assertEqual(router._health[0], (0, False))
+        self.assertEqual(router._checking, set())
+
+    def test_lag_check_in_progress(self):
+        lag_check = mock.Mock(return_value=0)
+        router = QueryRouter(self.primary, self.replicas, lag_check=lag_check,
+                             max_lag=1, clock=self.clock)
+        # Another thread checks replica 0, never checked before
+        router._checking.add(0)
+        self.assertIs(router.connection_for(self.select), self.replicas[1])
+        self.assertEqual(lag_check.call_count, 1)
+
+    def test_wrong_options(self):
+        with self.assertRaises(ValueError):
+            QueryRouter(self.primary, strategy='random')
+        with self.assertRaises(ValueError):
+            QueryRouter(self.primary, lag_check=lambda conn: 0)
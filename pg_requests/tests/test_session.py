@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from pg_requests import query_facade as qf
+from pg_requests.session import Session
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        # users table emulation
+        self.rows = {1: (1, 'John'), 2: (2, 'Jane'), 3: (3, 'Bob')}
+        self.cursor = mock.Mock()
+        self.cursor.description = (('id', 23), ('name', 25))
+        self.cursor.execute.side_effect = self._execute
+        self.cursor.mogrify.side_effect = lambda sql, values: (sql, values)
+        self.fetched = []
+        self.session = qf.session(self.cursor)
+
+    def _execute(self, sql, values=None):
+        if values is None:
+            return
+        keys = values[0]
+        self.fetched.append(keys)
+        self.cursor.fetchall.return_value = [
+            self.rows[key] for key in keys if key in self.rows]
+
+    def test_get(self):
+        self.assertIsInstance(self.session, Session)
+        user = self.session.get('users', 1)
+        self.assertEqual((user.id, user.name), (1, 'John'))
+        self.assertIs(self.session.get('users', 1), user)
+        self.assertEqual(self.fetched, [(1, )])
+        self.assertIn(('users', 1), self.session)
+
+        sql = self.cursor.execute.call_args[0][0]
+        self.assertEqual(sql, 'SELECT * FROM users WHERE id IN %s')
+
+    def test_get_missing(self):
+        self.assertIsNone(self.session.get('users', 10))
+        self.assertIsNone(self.session.get('users', 10))
+        # missing keys are cached too
+        self.assertEqual(self.fetched, [(10, )])
+
+    def test_get_many(self):
+        self.session.get('users', 2)
+        users = self.session.get_many('users', [3, 10, 2, 1, 3])
+        self.assertEqual([user and user.id for user in users],
+                         [3, None, 2, 1, 3])
+        # only missing keys are fetched, once
+        self.assertEqual(self.fetched, [(2, ), (3, 10, 1)])
+
+        self.session.get_many('users', [1, 2, 3])
+        self.assertEqual(len(self.fetched), 2)
+
+    def test_get_many_key(self):
+        self.session.get_many('users', [1, 2], key='name')
+        sql = self.cursor.execute.call_args[0][0]
+        self.assertEqual(sql, 'SELECT * FROM users WHERE name IN %s')
+
+        with self.assertRaises(ValueError):
+            self.session.get('users', 1, key='id; DROP TABLE users')
+
+    def test_get_many_string_keys(self):
+        # e.g uuid keys are fetched as strings
+        self.rows = {'b2': ('b2', 'Jane'), 'a1': ('a1', 'John')}
+        users = self.session.get_many('users', ['b2', 'c3', 'a1'])
+        self.assertEqual([user and user.name for user in users],
+                         ['Jane', None, 'John'])
+        self.assertEqual(self.cursor.execute.call_args[0][1],
+                         (('b2', 'c3', 'a1'), ))
+
+    def test_execute_invalidates(self):
+        self.session.get_many('users', [1, 2])
+        self.session.get_many('orders', [1])
+        self.session.execute(qf.update('users').data(name='Johnny')
+                             .filter(id=1))
+        self.assertNotIn(('users', 1), self.session)
+        self.assertNotIn(('users', 2), self.session)
+        self.assertIn(('orders', 1), self.session)
+
+        # select queries don't invalidate anything
+        self.session.get('users', 1)
+        self.session.execute(qf.select('users'))
+        self.assertIn(('users', 1), self.session)
+
+        # inserted rows may be cached as missing ones
+        self.session.get('users', 10)
+        self.session.execute(qf.insert('users').data(id=10, name='Ann'))
+        self.assertNotIn(('users', 10), self.session)
+
+    def test_execute_unknown_table(self):
+        self.session.get('users', 1)
+        query = mock.Mock(spec=['execute'])
+        self.session.execute(query)
+        query.execute.assert_called_once_with(self.cursor)
+        self.assertNotIn(('users', 1), self.session)
+
+    def test_invalidate(self):
+        self.session.get_many('users', [1, 2])
+        self.session.invalidate('users', pks=[1])
+        self.assertNotIn(('users', 1), self.session)
+        self.assertIn(('users', 2), self.session)
+
+        self.session.invalidate()
+        self.assertNotIn(('users', 2), self.session)
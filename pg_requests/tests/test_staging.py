@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import unittest
+from collections import OrderedDict
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from pg_requests import query_facade as qf
+
+
+class StagingTest(unittest.TestCase):
+    def test_staged_rows(self):
+        staged = qf.stage([(1, 'a'), (2, 'b')], like='users',
+                          columns=('id', 'name'))
+        self.assertEqual(staged.staging_table, 'pg_temp._staging_users')
+        self.assertEqual(staged.columns, ('id', 'name'))
+        self.assertEqual(len(staged), 2)
+        self.assertEqual(staged.copy.encode(), b'1\ta\n2\tb\n')
+
+        staged = qf.stage([OrderedDict([('id', 1), ('name', 'a')])],
+                          like='users')
+        self.assertEqual(staged.columns, ('id', 'name'))
+        staged = qf.stage(OrderedDict([('id', [1]), ('name', ['a'])]),
+                          like='public.users', staging_table='tmp_users')
+        self.assertEqual(staged.columns, ('id', 'name'))
+        self.assertEqual(staged.staging_table, 'pg_temp.tmp_users')
+        staged = qf.stage([(1, )], like='users', columns=('id', ),
+                          staging_table='pg_temp.tmp_users')
+        self.assertEqual(staged.staging_table, 'pg_temp.tmp_users')
+
+        with self.assertRaises(ValueError):
+            qf.stage([(1, 'a')], like='users')
+        with self.assertRaises(ValueError):
+            qf.stage([(1, 'a')], like='users', columns=('id', ))
+        with self.assertRaises(ValueError):
+            qf.stage([], like='users', columns=('id', ))
+        # Permanent tables can't be used as staging ones
+        with self.assertRaises(ValueError):
+            qf.stage([(1, )], like='users', columns=('id', ),
+                     staging_table='public.users')
+
+    def test_upsert(self):
+        merge = qf.stage([(1, 'a', 'x')], like='users',
+                         columns=('id', 'name', 'email'))\
+            .merge_into('users', key=('id', ))
+        self.assertEqual(
+            merge.create_sql,
+            'DROP TABLE IF EXISTS pg_temp._staging_users; '
+            'CREATE TEMPORARY TABLE pg_temp._staging_users AS '
+            'SELECT id, name, email FROM users WITH NO DATA')
+        self.assertEqual(
+            merge.upsert_sql(),
+            'WITH merged AS (INSERT INTO users (id, name, email) '
+            'SELECT id, name, email FROM pg_temp._staging_users '
+            'ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, '
+            'email = EXCLUDED.email WHERE (users.name, users.email) IS '
+            'DISTINCT FROM (EXCLUDED.name, EXCLUDED.email) '
+            'RETURNING (xmax = 0) AS inserted) '
+            'SELECT count(*) FILTER (WHERE inserted), '
+            'count(*) FILTER (WHERE NOT inserted) FROM merged')
+
+        merge = qf.stage([(1, 'a')], like='users', columns=('id', 'name'))\
+            .merge_into('users', key='id', update=())
+        self.assertIn('ON CONFLICT (id) DO NOTHING', merge.upsert_sql())
+
+    def test_update_insert(self):
+        merge = qf.stage([(1, 2, 'a')], like='members',
+                         columns=('group_id', 'user_id', 'role'))\
+            .merge_into('members', key=('group_id', 'user_id'),
+                        method='update_insert')
+        self.assertEqual(
+            merge.update_sql(),
+            'UPDATE members AS t SET role = s.role '
+            'FROM pg_temp._staging_members AS s '
+            'WHERE t.group_id = s.group_id AND t.user_id = s.user_id AND '
+            '(t.role) IS DISTINCT FROM (s.role)')
+        self.assertEqual(
+            merge.insert_sql(),
+            'INSERT INTO members (group_id, user_id, role) '
+            'SELECT s.group_id, s.user_id, s.role '
+            'FROM pg_temp._staging_members AS s '
+            'WHERE NOT EXISTS (SELECT 1 FROM members AS t WHERE '
+            't.group_id = s.group_id AND t.user_id = s.user_id)')
+
+    def test_wrong_merge(self):
+        staged = qf.stage([(1, 'a')], like='users', columns=('id', 'name'))
+        with self.assertRaises(ValueError):
+            staged.merge_into('users', key=('email', ))
+        with self.assertRaises(ValueError):
+            staged.merge_into('users', key=('id', ), update=('id', ))
+        with self.assertRaises(ValueError):
+            staged.merge_into('users', key=('id', ), method='merge')
+
+    def test_execute(self):
+        cursor = mock.Mock()
+        cursor.fetchone.return_value = (1, 2)
+        result = qf.stage([(1, 'a'), (2, 'b'), (3, 'c')], like='users',
+                          columns=('id', 'name'))\
+            .merge_into('users', key=('id', ))\
+            .execute(cursor)
+        self.assertEqual(result, (1, 2))
+        self.assertEqual((result.inserted, result.updated), (1, 2))
+
+        executed = [c[0][0] for c in cursor.execute.call_args_list]
+        self.assertEqual(len(executed), 4)
+        self.assertTrue(executed[0].startswith('DROP TABLE IF EXISTS'))
+        self.assertEqual(executed[1], 'ANALYZE pg_temp._staging_users')
+        self.assertTrue(executed[2].startswith('WITH merged AS'))
+        self.assertEqual(executed[3],
+                         'DROP TABLE IF EXISTS pg_temp._staging_users')
+        cursor.copy_expert.assert_called_once_with(
+            'COPY pg_temp._staging_users (id, name) '
+            'FROM STDIN WITH (FORMAT text)',
+            mock.ANY)
+
+    def test_execute_update_insert(self):
+        cursor = mock.Mock()
+        cursor.rowcount = 3
+        result = qf.stage([(1, 'a')], like='users', columns=('id', 'name'))\
+            .merge_into('users', key=('id', ), method='update_insert')\
+            .execute(cursor)
+        self.assertEqual(result, (3, 3))
+        executed = [c[0][0] for c in cursor.execute.call_args_list]
+        self.assertTrue(executed[2].startswith('UPDATE users'))
+        self.assertTrue(executed[3].startswith('INSERT INTO users'))
+
+    def test_execute_error(self):
+        merge = qf.stage([(1, 'a')], like='users', columns=('id', 'name'))\
+            .merge_into('users', key=('id', ))
+        cursor = mock.Mock()
+        cursor.copy_expert.side_effect = RuntimeError('COPY failed')
+        with self.assertRaises(RuntimeError):
+            merge.execute(cursor)
+        # The table is dropped with the rollback of the failed transaction
+        self.assertEqual(cursor.execute.call_count, 1)
+
+        cursor.connection.autocommit = True
+        cursor.execute.reset_mock()
+        with self.assertRaises(RuntimeError):
+            merge.execute(cursor)
+        executed = [c[0][0] for c in cursor.execute.call_args_list]
+        self.assertEqual(executed[-1],
+                         'DROP TABLE IF EXISTS pg_temp._staging_users')
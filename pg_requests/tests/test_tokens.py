@@ -2,8 +2,8 @@
 import unittest
 from pg_requests.exceptions import TokenError
 from pg_requests.operators import And, JOIN
-from pg_requests.tokens import Token, TupleValue, CommaValue, StringValue, \
-    NullValue, FilterValue, DictValue, CommaDictValue
+from pg_requests.tokens import Token, TokenValue, TupleValue, CommaValue, \
+    StringValue, NullValue, FilterValue, DictValue, CommaDictValue
 
 
 class TokensTest(unittest.TestCase):
@@ -175,3 +175,18 @@ class TokenValuesTest(unittest.TestCase):
             ('b = %s, a = %s', (True, 1)),
         )
         self.assertIn(t_val.eval(), expected)
+
+    def test_compact_instances(self):
+        token = Token(template='WHERE {}', value_type=FilterValue)
+        token.value = {'a': 1}
+        self.assertFalse(hasattr(token, '__dict__'))
+
+        def subclasses(cls):
+            for subclass in cls.__subclasses__():
+                yield subclass
+                for item in subclasses(subclass):
+                    yield item
+
+        for cls in subclasses(TokenValue):
+            self.assertIn('__slots__', cls.__dict__, cls)
+        self.assertFalse(hasattr(token.value, '__dict__'))
@@ -2,11 +2,21 @@
 import abc
 import re
 from pg_requests.exceptions import TokenError
-from pg_requests.operators import ConditionOperator, And, QueryObject, Evaluable
+from pg_requests.operators import ConditionOperator, And, QueryObject, \
+    Evaluable, JOIN
 
 
 class TokenValue(Evaluable):
     """Base class of a parseable unit"""
+    __slots__ = ('value', )
+
+    # Kind of .eval() result, it lets renderer skip result type checks:
+    #   'str' - sql string, 'pair' - (sql string, values) tuple,
+    #   'null' - no value, 'mixed' - 'str' or 'pair',
+    #   None - anything else, evaluated with generic Token.eval()
+    # 'pair' values can implement .eval_into(values), it appends values to the
+    # shared values list and returns sql string
+    EVAL_KIND = None
 
     def __init__(self, value):
         self.value = self.validate(value)
@@ -39,6 +49,8 @@ class TokenValue(Evaluable):
 
 class Token(Evaluable):
     """Query token representation"""
+    __slots__ = ('_value', 'value_type', 'template', 'is_set', 'required',
+                 'subtoken')
 
     TEMPLATE_RE = re.compile(r'\{.*\}')
 
@@ -153,12 +165,17 @@ class StringValue(TokenValue):
     """ Simple string token value. It is appropriate for table_name or
     for options which don't require any parameters to substitute
     """
+    __slots__ = ()
+    EVAL_KIND = 'str'
+
     def eval(self):
         return str(self.value)
 
 
 class NullValue(TokenValue):
     """ Null (None) token value"""
+    __slots__ = ()
+    EVAL_KIND = 'null'
 
     def eval(self):
         return None
@@ -167,22 +184,80 @@ class NullValue(TokenValue):
 class CommaValue(TokenValue):
     """Comma-separated value is the value which can be evaluated with simple
     ','.join() operation"""
+    __slots__ = ()
+    EVAL_KIND = 'str'
 
     @classmethod
-    def validate(cls, value):
+    def _validate_list(cls, value):
         if not isinstance(value, (list, tuple)):
             raise ValueError("Wrong value type for '%s' instance, must be list"
                              "or tuple" % cls.__name__)
         return value
 
+    @classmethod
+    def validate(cls, value):
+        value = cls._validate_list(value)
+        for item in value:
+            # NOTE: bound parameters would be lost here, see FieldsValue
+            if isinstance(item, Evaluable) and getattr(item, 'values', None):
+                raise ValueError(
+                    "'%s' has bound parameters, they are not supported by "
+                    "'%s'" % (item, cls.__name__))
+        return value
+
     def eval(self):
         return ', '.join(self.value)
 
 
+class FieldsValue(CommaValue):
+    """Comma-separated value of fields or expressions: SELECT fields,
+    DISTINCT ON, GROUP BY and ORDER BY items. Evaluable items, e.g function
+    calls with FILTER clause, can bring bound parameters"""
+    __slots__ = ()
+    EVAL_KIND = 'mixed'
+
+    @classmethod
+    def validate(cls, value):
+        return cls._validate_list(value)
+
+    def eval(self):
+        parts, values = [], []
+        for field in self.value:
+            if isinstance(field, Evaluable):
+                field = field.eval()
+                if isinstance(field, tuple):
+                    field, field_values = field
+                    values.extend(field_values)
+            parts.append(field)
+
+        if values:
+            return ', '.join(parts), tuple(values)
+        return ', '.join(parts)
+
+
+class SubqueryValue(TokenValue):
+    """Sub-query value, query builder instance is evaluated with .get_raw()
+    """
+    __slots__ = ()
+    EVAL_KIND = 'pair'
+
+    @classmethod
+    def validate(cls, value):
+        if not hasattr(value, 'get_raw'):
+            raise ValueError("Wrong value type for '%s' instance, must be "
+                             "query builder" % cls.__name__)
+        return value
+
+    def eval(self):
+        return self.value.get_raw()
+
+
 class TupleValue(TokenValue):
     """Useful for InsertQuery builder VALUES clause when we just need to form
     string template with tuple substitution values. The output is represented
     as a tuple."""
+    __slots__ = ()
+    EVAL_KIND = 'pair'
 
     @classmethod
     def validate(cls, value):
@@ -205,6 +280,7 @@ class TupleValue(TokenValue):
 
 class DictValue(TokenValue):
     """Dict value"""
+    __slots__ = ()
 
     @classmethod
     def validate(cls, value):
@@ -217,10 +293,41 @@ class DictValue(TokenValue):
         return self.value
 
 
+class SampleValue(TokenValue):
+    """TABLESAMPLE clause value: dict(method=..., percent=..., seed=...)
+    Sampling percent and seed are passed as parameters
+    """
+    __slots__ = ()
+    EVAL_KIND = 'pair'
+
+    METHODS = ('SYSTEM', 'BERNOULLI')
+
+    @classmethod
+    def validate(cls, value):
+        value = DictValue.validate(value)
+        if value.get('method') not in cls.METHODS:
+            raise ValueError("Wrong sampling method '%s', must be one of %s" %
+                             (value.get('method'), cls.METHODS))
+        return value
+
+    def eval(self):
+        """Evaluate sampling method
+
+        :return: 'SYSTEM (%s) REPEATABLE (%s)', (1, 42)
+        """
+        if self.value.get('seed') is None:
+            return ('{} (%s)'.format(self.value['method']),
+                    (self.value['percent'], ))
+        return ('{} (%s) REPEATABLE (%s)'.format(self.value['method']),
+                (self.value['percent'], self.value['seed']))
+
+
 class CommaDictValue(TokenValue):
     """Substitution key value token value
     Use case: dict(a=1, b=2) --> "a=%s, b=%s", (1, 2)
     """
+    __slots__ = ()
+    EVAL_KIND = 'pair'
 
     def eval(self):
         """Evaluate dict as a string and values tuple
@@ -235,6 +342,8 @@ class CommaDictValue(TokenValue):
 
 class FilterValue(TokenValue):
     """Complex value type is used in WHERE clause"""
+    __slots__ = ()
+    EVAL_KIND = 'pair'
 
     @classmethod
     def validate(cls, value):
@@ -264,6 +373,14 @@ class FilterValue(TokenValue):
         sql_str, values = self.value.eval()
         return sql_str, values
 
+    def eval_into(self, values):
+        """Evaluate conditional value appending values to the given list
+
+        :param values: list: shared values list
+        :rtype : str
+        """
+        return self.value.render_into(values)
+
     def update(self, value):
         """Update conditional value with And operator.
         This is used by .filter() operation, so if
@@ -272,3 +389,70 @@ class FilterValue(TokenValue):
         """
         validated = self.validate(value)
         self.value = And(self.value, validated)
+
+
+class JoinValue(TokenValue):
+    """Ordered list of JOIN clauses. Every clause is a dict with keys:
+    join_type, table, alias, lateral, on, using.
+
+    Table can be a table name or a sub-query (query builder instance), ON
+    condition is either a raw sql string or a filter value, so it supports
+    the same conditions as .filter() including F objects
+    """
+    __slots__ = ()
+    EVAL_KIND = 'pair'
+
+    @classmethod
+    def validate(cls, value):
+        if isinstance(value, dict):
+            value = [value]
+        if not isinstance(value, list):
+            raise ValueError("Wrong value type for '%s' instance, must be "
+                             "dict or list" % cls.__name__)
+        return value
+
+    def update(self, value):
+        """Append JOIN clauses
+
+        :param value: dict | list
+        """
+        self.value.extend(self.validate(value))
+
+    def eval(self):
+        """Evaluate JOIN clauses
+
+        :rtype : tuple
+        :return: 'INNER JOIN orders AS o ON ( o.user_id = users.id )', ()
+        """
+        clauses, values = [], []
+        for join in self.value:
+            clause = [join['join_type']]
+            if join['lateral']:
+                clause.append('LATERAL')
+
+            table = join['table']
+            if hasattr(table, 'get_raw'):
+                # Sub-query
+                sql, table_values = table.get_raw()
+                table = '({})'.format(sql)
+                values.extend(table_values)
+            clause.append(table)
+
+            if join['alias']:
+                clause.append('AS {}'.format(join['alias']))
+
+            on, using = join['on'], join['using']
+            if isinstance(on, str):
+                clause.append('ON ({})'.format(on))
+            elif on is not None:
+                sql, on_values = on.eval()
+                clause.append('ON {}'.format(sql))
+                values.extend(on_values)
+            elif using:
+                clause.append('USING ({})'.format(CommaValue(using).eval()))
+            elif join['lateral'] and join['join_type'] != JOIN.CROSS:
+                # LATERAL sub-query without condition, join every row
+                clause.append('ON true')
+            clauses.append(' '.join(clause))
+
+        return ' '.join(clauses), tuple(values)